@@ -6,4 +6,4 @@ class IsAdminOrSelf(BasePermission):
         if request.user.is_admin:
             return True
         else:
-            return obj == request.user
+            return obj.id == request.user.id
@@ -19,22 +19,29 @@ from django.contrib.sites.shortcuts import get_current_site
 from rest_framework.reverse import reverse as api_reverse
 
 from rest_framework_simplejwt.tokens import RefreshToken, OutstandingToken, BlacklistedToken
+from rest_framework_simplejwt.utils import aware_utcnow
 import jwt
 
 from django.conf import settings
 
 from common.utils import send_mail
 
-from accounts.signals import user_logged_in
+from accounts.signals import user_logged_in, user_registered
 
 from .permissions import IsAdminOrSelf
 
 from .validators import ValidatePassword
     
 def InvalidatedAllUserTokens(user_id):
-    tokens = OutstandingToken.objects.filter(user_id=user_id)
-    for token in tokens:            
-        t, _ = BlacklistedToken.objects.get_or_create(token=token)
+
+    # one insert for the live tokens not blacklisted yet, expired ones are refused
+    # anyway and left to prune_tokens
+    token_ids = OutstandingToken.objects.filter(
+        user_id = user_id, expires_at__gt = aware_utcnow(), blacklistedtoken__isnull = True).values_list('id', flat=True)
+    BlacklistedToken.objects.bulk_create([BlacklistedToken(token_id = token_id) for token_id in token_ids], ignore_conflicts=True)
+
+    # access tokens too
+    Account.RevokeTokens(user_id)
 
 class LoginAPIView(GenericAPIView):
 
@@ -122,6 +129,9 @@ class ListCreateAccountAPIView(ListCreateAPIView):
             
         email_data = {'email_body': email_body, 'email_to': user.email, 'email_subject': 'TopTal Soccer verify account'}
         send_mail(email_data)        
+
+        # notify listeners
+        user_registered.send(sender=self.__class__, user_id=user.pk)
         
         serializer.validated_data['message'] = 'User successfully created. Please verify your e-mail to activate user account.'
        
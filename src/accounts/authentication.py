@@ -0,0 +1,139 @@
+import threading
+import time
+
+from django.conf import settings
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.settings import api_settings
+
+from .models import Account
+
+# jwt authentication without the account row. Account.tokens() puts is_admin,
+# is_staff, team_id and token_version in the tokens and the request user is built
+# from them.
+#
+# what a token can't know, the account being deactivated or its tokens revoked
+# (token_version bumped), is checked against a small account state cached in the
+# process for AUTH_STATE_TTL seconds. a save or a revocation drops the state of the
+# account here right away, other processes see it once their copy expires
+
+# claims of the request user, and the account columns they're checked against
+CLAIMS = ('is_admin', 'is_staff', 'team_id', 'token_version')
+
+
+class _States():
+
+    def __init__(self):
+
+        self.lock   = threading.Lock()
+        self.states = {}
+
+    def Get(self, user_id):
+
+        # {'is_active': .., claims..} or None for a missing account
+        now = time.monotonic()
+        with self.lock:
+            entry = self.states.get(user_id)
+        if entry is not None and entry[0] > now:
+            return entry[1]
+
+        row = Account.objects.filter(id = user_id).values_list('is_active', 'is_admin', 'is_staff', 'team__id', 'token_version').first()
+        state = None if row is None else dict(zip(('is_active',) + CLAIMS, row))
+
+        with self.lock:
+            if len(self.states) >= settings.AUTH_STATE_SIZE:
+                self.states.clear()
+            self.states[user_id] = (now + settings.AUTH_STATE_TTL, state)
+
+        return state
+
+    def Drop(self, user_id):
+
+        with self.lock:
+            self.states.pop(user_id, None)
+
+    def DropTeam(self, team_id):
+
+        # the accounts cached as owners of the team
+        with self.lock:
+            for user_id in [user_id for user_id, (_, state) in self.states.items() if state is not None and state['team_id'] == team_id]:
+                del self.states[user_id]
+
+    def Clear(self):
+
+        with self.lock:
+            self.states.clear()
+
+
+states = _States()
+
+
+class ClaimsUser():
+
+    # the request user of a claims token. fields that aren't claims (email, names,
+    # set_password...) come from the account row, loaded on first use
+    is_active           = True
+    is_authenticated    = True
+    is_anonymous        = False
+
+    def __init__(self, user_id, state):
+
+        self.id         = user_id
+        self.pk         = user_id
+        self.is_admin   = state['is_admin']
+        self.is_staff   = state['is_staff']
+        self.team_id    = state['team_id']
+
+    def __getattr__(self, name):
+
+        if name.startswith('__'):
+            raise AttributeError(name)
+
+        account = self.__dict__.get('_account')
+        if account is None:
+            account = self._account = Account.objects.get(pk = self.id)
+
+        return getattr(account, name)
+
+    def __eq__(self, other):
+        return isinstance(other, (ClaimsUser, Account)) and other.pk == self.pk
+
+    def __hash__(self):
+        return hash(self.pk)
+
+    def __str__(self):
+        return f'user {self.id}'
+
+
+class ClaimsJWTAuthentication(JWTAuthentication):
+
+    @staticmethod
+    def _Valid(validated_token, state):
+
+        # revoked, or the account changed since the token was issued. a token issued
+        # before the user got a team is still good, the team comes from the state
+        return state is not None and state['is_active'] and all(
+            validated_token.get(claim) == state[claim] or (claim == 'team_id' and validated_token.get(claim) is None) for claim in CLAIMS)
+
+    def get_user(self, validated_token):
+
+        # tokens issued before the claims existed still load the account
+        if 'token_version' not in validated_token:
+            return super().get_user(validated_token)
+
+        user_id = validated_token[api_settings.USER_ID_CLAIM]
+        state   = states.Get(user_id)
+
+        # the cached state can be older than the token, read it again before refusing
+        if not self._Valid(validated_token, state):
+            states.Drop(user_id)
+            state = states.Get(user_id)
+
+        if state is None:
+            raise AuthenticationFailed('User not found', code='user_not_found')
+        if not state['is_active']:
+            raise AuthenticationFailed('User is inactive', code='user_inactive')
+        if not self._Valid(validated_token, state):
+            raise AuthenticationFailed('Token is no longer valid', code='token_not_valid')
+
+        return ClaimsUser(user_id, state)
@@ -0,0 +1,43 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from rest_framework_simplejwt.token_blacklist.models import OutstandingToken
+from rest_framework_simplejwt.utils import aware_utcnow
+
+
+class Command(BaseCommand):
+
+    help = 'Delete expired outstanding tokens and their blacklist entries in bounded batches.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=settings.TOKEN_PRUNE_BATCH_SIZE, help='Tokens deleted per statement.')
+        parser.add_argument('--loop', action='store_true', help='Keep running and prune every interval.')
+        parser.add_argument('--interval', type=float, default=3600, help='Seconds between prunes when looping.')
+
+    def handle(self, *args, **options):
+
+        while True:
+
+            pruned = self._Prune(options['batch_size'])
+            self.stdout.write(self.style.SUCCESS(f'{pruned} expired tokens pruned.'))
+
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
+
+    def _Prune(self, batch_size):
+
+        now     = aware_utcnow()
+        pruned  = 0
+
+        while True:
+
+            # a short delete per batch instead of one holding locks on the whole
+            # table, blacklist entries of the tokens go with them (cascade)
+            token_ids = list(OutstandingToken.objects.filter(expires_at__lte = now).values_list('id', flat=True)[:batch_size])
+            if not token_ids:
+                return pruned
+
+            OutstandingToken.objects.filter(id__in = token_ids).delete()
+            pruned += len(token_ids)
@@ -0,0 +1,18 @@
+# Generated by Django 3.1.4 on 2026-10-18 02:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='account',
+            name='token_version',
+            field=models.IntegerField(default=0),
+        ),
+    ]
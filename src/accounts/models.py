@@ -1,4 +1,7 @@
 from django.db import models
+from django.db.models import F
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
 from django.contrib.auth.models import (BaseUserManager, AbstractBaseUser)
 from django.conf import settings
 
@@ -63,6 +66,7 @@ class Account(AbstractBaseUser):
     is_staff        = models.BooleanField(default=False) 
     is_admin        = models.BooleanField(default=False)
     is_superuser    = models.BooleanField(default=False)
+    token_version   = models.IntegerField(default=0) # bumped to revoke every token already issued
        
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ['first_name', 'last_name'] 
@@ -72,6 +76,28 @@ class Account(AbstractBaseUser):
     def __str__(self): 
         return self.email
 
+    def save(self, force_insert=False, force_update=False, using=None, update_fields=None):
+
+        # token_version only moves with the update of RevokeTokens, a full save of an
+        # instance read before it (a login, a password change) would accept the revoked
+        # tokens again. it's written when named in update_fields
+        if update_fields is None and not force_insert and not self._state.adding:
+            skipped = self.get_deferred_fields() | {'token_version'}
+            update_fields = [field.attname for field in self._meta.concrete_fields
+                             if not field.primary_key and field.attname not in skipped]
+
+        super().save(force_insert=force_insert, force_update=force_update, using=using, update_fields=update_fields)
+
+    @staticmethod
+    def RevokeTokens(user_id):
+
+        # every access token issued so far stops being accepted
+        Account.objects.filter(id = user_id).update(token_version = F('token_version') + 1)
+
+        # authentication imports this module
+        from .authentication import states
+        states.Drop(user_id)
+
     def has_perm(self, perm, obj=None):
         return self.is_admin
 
@@ -81,8 +107,23 @@ class Account(AbstractBaseUser):
     def tokens(self):
         
         refresh = RefreshToken.for_user(self)
+
+        # claims of accounts.authentication.ClaimsJWTAuthentication, copied to the
+        # access token. version and team read again, they change without this instance
+        token_version, team_id = Account.objects.filter(pk = self.pk).values_list('token_version', 'team__id').get()
+        refresh['is_admin']         = self.is_admin
+        refresh['is_staff']         = self.is_staff
+        refresh['team_id']          = team_id
+        refresh['token_version']    = token_version
         
         return {
             'refresh': str(refresh),
             'access': str(refresh.access_token)            
-        }
\ No newline at end of file
+        }
+
+@receiver([post_save, post_delete], sender=Account)
+def drop_account_state(sender, instance, **kwargs):
+
+    # deactivated or deleted, the next request reads the account again
+    from .authentication import states
+    states.Drop(instance.id)
@@ -1,3 +1,4 @@
 from django.dispatch import Signal
 
-user_logged_in = Signal(providing_args=['user_id'])
\ No newline at end of file
+user_logged_in = Signal(providing_args=['user_id'])
+user_registered = Signal(providing_args=['user_id'])
\ No newline at end of file
@@ -1,13 +1,20 @@
 import json
+from datetime import timedelta
+from io import StringIO
 
 from django.contrib.auth import get_user_model
+from django.core.management import call_command
 from django.urls import reverse
+from django.utils import timezone
 from rest_framework import status
 from rest_framework.authtoken.models import Token
 from rest_framework.reverse import reverse as api_reverse
 from rest_framework.test import APITestCase
+from rest_framework_simplejwt.tokens import RefreshToken, OutstandingToken, BlacklistedToken
 
 from accounts.api.serializers import AccountFullSerializer
+from accounts.api.views import InvalidatedAllUserTokens
+from accounts.authentication import ClaimsJWTAuthentication, ClaimsUser, states
 
 from accounts.api.consts import MAX_USER_LOGIN_ATTEMPTS
 
@@ -285,4 +292,123 @@ class NormalUserChangePassword(APITestCase):
             'password2': 'abc101112',             
             }
         response = self.client.put(url, data=data, HTTP_AUTHORIZATION='Bearer ' + self.user.tokens()['access'])        
-        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)        
\ No newline at end of file
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class ClaimsAuthenticationTestCase(APITestCase):
+
+    def setUp(self):
+
+        states.Clear()
+        self.user = User.objects.create_user('John', 'Verified', 'user@soccer.com', 'abc1234')
+        self.authentication = ClaimsJWTAuthentication()
+
+    def _Authenticate(self, raw_token):
+        return self.authentication.get_user(self.authentication.get_validated_token(raw_token))
+
+    def _Get(self, raw_token):
+        return self.client.get(api_reverse('accounts-api:rud-user', kwargs={'id': self.user.id}), HTTP_AUTHORIZATION='Bearer ' + raw_token)
+
+    def test_user_from_claims(self):
+
+        access_token = self.user.tokens()['access']
+        self._Authenticate(access_token)
+
+        # the account state is cached, the account row is only read when a field needs it
+        with self.assertNumQueries(0):
+            user = self._Authenticate(access_token)
+        self.assertIsInstance(user, ClaimsUser)
+        self.assertEqual((user.id, user.is_admin, user.team_id), (self.user.id, False, None))
+
+        with self.assertNumQueries(1):
+            self.assertEqual(user.email, self.user.email)
+        self.assertEqual(self._Get(access_token).status_code, status.HTTP_200_OK)
+
+    def test_tokens_without_claims(self):
+
+        access_token = str(RefreshToken.for_user(self.user).access_token)
+        self.assertEqual(self._Authenticate(access_token), self.user)
+
+    def test_deactivated_account(self):
+
+        access_token = self.user.tokens()['access']
+        self.assertEqual(self._Get(access_token).status_code, status.HTTP_200_OK)
+
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self._Get(access_token).status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_revoked_tokens(self):
+
+        access_token = self.user.tokens()['access']
+        response = self.client.post(api_reverse('accounts-api:logout-all'), HTTP_AUTHORIZATION='Bearer ' + access_token)
+        self.assertEqual(response.status_code, status.HTTP_205_RESET_CONTENT)
+
+        self.assertEqual(self._Get(access_token).status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertEqual(self._Get(self.user.tokens()['access']).status_code, status.HTTP_200_OK)
+
+    def test_save_keeps_tokens_revoked(self):
+
+        access_token    = self.user.tokens()['access']
+        stale           = User.objects.get(id=self.user.id)
+        User.RevokeTokens(self.user.id)
+
+        # a failed login saves the attempt count of the account it read
+        response = self.client.post(api_reverse('accounts-api:login'), data={'email': self.user.email, 'password': 'wrong'})
+        self.assertNotEqual(response.status_code, status.HTTP_200_OK)
+        stale.first_name = 'Jack'
+        stale.save()
+
+        self.assertEqual(User.objects.get(id=self.user.id).token_version, 1)
+        self.assertEqual(User.objects.get(id=self.user.id).first_name, 'Jack')
+        self.assertEqual(self._Get(access_token).status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_claims_changed(self):
+
+        access_token = self.user.tokens()['access']
+        self.assertEqual(self._Get(access_token).status_code, status.HTTP_200_OK)
+        User.objects.filter(id=self.user.id).update(is_admin=True)
+
+        # the cached state still matches the token until it expires or is dropped
+        self.assertEqual(self._Get(access_token).status_code, status.HTTP_200_OK)
+        self.user.is_admin = True
+        self.user.save(update_fields=['is_admin'])
+        self.assertEqual(self._Get(access_token).status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+class TokenHousekeepingTestCase(APITestCase):
+
+    def setUp(self):
+
+        self.user = User.objects.create_user('John', 'Verified', 'user@soccer.com', 'abc1234')
+        for i in range(5):
+            self.user.tokens()
+
+    def test_logout_all_blacklists_in_one_insert(self):
+
+        access_token = self.user.tokens()['access']
+        RefreshToken.for_user(self.user).blacklist()
+
+        # select of the live tokens not blacklisted yet, one insert, the version bump
+        with self.assertNumQueries(3):
+            InvalidatedAllUserTokens(self.user.id)
+
+        self.assertEqual(BlacklistedToken.objects.filter(token__user=self.user).count(), 7)
+        self.assertEqual(self.client.post(api_reverse('accounts-api:logout-all'), HTTP_AUTHORIZATION='Bearer ' + access_token).status_code, status.HTTP_401_UNAUTHORIZED)
+
+        # nothing left to blacklist
+        with self.assertNumQueries(2):
+            InvalidatedAllUserTokens(self.user.id)
+
+    def test_prune_tokens(self):
+
+        InvalidatedAllUserTokens(self.user.id)
+        self.user.tokens()
+        OutstandingToken.objects.filter(id__in=OutstandingToken.objects.order_by('id').values('id')[:4]).update(expires_at=timezone.now() - timedelta(days=1))
+
+        out = StringIO()
+        call_command('prune_tokens', '--batch-size', '3', stdout=out)
+
+        self.assertIn('4 expired tokens pruned.', out.getvalue())
+        self.assertEqual(OutstandingToken.objects.count(), 2)
+        self.assertEqual(BlacklistedToken.objects.count(), 1)
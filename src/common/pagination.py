@@ -0,0 +1,328 @@
+import functools
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from collections import OrderedDict
+from datetime import datetime
+
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.core.paginator import Paginator as DjangoPaginator
+from django.db import connections
+from django.db.models import Q
+from django.utils.functional import cached_property
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class KeysetPagination(BasePagination):
+
+    # pages are read with "where (field, id) > last seen position" instead of offsets,
+    # so deep pages cost the same as the first one. the total count is never computed.
+    #
+    # views can sort on other columns by declaring keyset_ordering_fields, a map from
+    # the ?ordering= name to the model field path. id is always the tie breaker.
+    #
+    # filters that impose their own order (a search ranked by relevance) can't be
+    # walked by a keyset, views list them in keyset_ordered_params and a cursor
+    # given with one of them is refused instead of returning the results unranked
+
+    cursor_query_param      = 'cursor'
+    ordering_query_param    = 'ordering'
+    page_size               = api_settings.PAGE_SIZE
+    invalid_cursor_message  = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+
+        for param in getattr(view, 'keyset_ordered_params', ()):
+            if request.query_params.get(param):
+                raise ValidationError({self.cursor_query_param: [f"Cursor pages can't be used with {param}, use page numbers."]})
+
+        self.base_url   = request.build_absolute_uri()
+        self.ordering   = self.get_ordering(request, view)
+
+        reverse, position = self.decode_cursor(request, queryset.model)
+
+        ordering = [self._Reverse(field) for field in self.ordering] if reverse else self.ordering
+        queryset = queryset.order_by(*ordering)
+        if position is not None:
+            queryset = queryset.filter(self._After(ordering, position))
+
+        # fetch one extra row to know if there is a page after this one
+        results     = list(queryset[:self.page_size + 1])
+        has_more    = len(results) > self.page_size
+        self.page   = results[:self.page_size]
+
+        if reverse:
+            self.page.reverse()
+            self.has_next       = position is not None
+            self.has_previous   = has_more
+        else:
+            self.has_next       = has_more
+            self.has_previous   = position is not None
+
+        # nothing left on this side, keep the position so the client can go back
+        self.first_position = self.GetPosition(self.page[0]) if self.page else position
+        self.last_position  = self.GetPosition(self.page[-1]) if self.page else position
+
+        return self.page
+
+    def get_ordering(self, request, view):
+
+        ordering_fields = getattr(view, 'keyset_ordering_fields', {})
+        requested = request.query_params.get(self.ordering_query_param, '')
+
+        field = ordering_fields.get(requested.lstrip('-'))
+        if field is None:
+            return ('id',)
+
+        if requested.startswith('-'):
+            return ('-' + field, '-id')
+
+        return (field, 'id')
+
+    def GetPosition(self, row):
+
+        position = []
+        for field in self.ordering:
+            value = row
+            for name in field.lstrip('-').split('__'):
+                value = value[name] if isinstance(value, dict) else getattr(value, name)
+            position.append(value)
+
+        return position
+
+    def decode_cursor(self, request, model):
+
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return False, None
+
+        # the position goes into the page query, each value must be valid for its field
+        try:
+            cursor = json.loads(urlsafe_b64decode(encoded.encode('ascii')))
+            reverse, position = bool(cursor['r']), cursor['p']
+            if not isinstance(position, list) or len(position) != len(self.ordering):
+                raise ValueError(position)
+
+            position = [self._Field(model, field).to_python(value) for field, value in zip(self.ordering, position)]
+            if None in position:
+                raise ValueError(position)
+        except (TypeError, ValueError, KeyError, DjangoValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+        return reverse, position
+
+    def encode_cursor(self, reverse, position):
+
+        encoded = urlsafe_b64encode(json.dumps({'r': int(reverse), 'p': position}, default=self._Encode).encode('ascii')).decode('ascii')
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded)
+
+    def get_next_link(self):
+
+        if not self.has_next:
+            return None
+
+        return self.encode_cursor(False, self.last_position)
+
+    def get_previous_link(self):
+
+        if not self.has_previous:
+            return None
+
+        return self.encode_cursor(True, self.first_position)
+
+    def get_paginated_response(self, data):
+
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data)
+        ]))
+
+    @staticmethod
+    def _Encode(value):
+
+        # datetimes keep their microseconds and timezone, to_python parses them back
+        if isinstance(value, datetime):
+            return value.isoformat()
+
+        raise TypeError(f'Object of type {type(value).__name__} is not JSON serializable')
+
+    @staticmethod
+    def _Field(model, field):
+
+        # model field at the end of a path like team__value
+        names = field.lstrip('-').split('__')
+        for name in names[:-1]:
+            model = model._meta.get_field(name).related_model
+
+        return model._meta.get_field(names[-1])
+
+    @staticmethod
+    def _Reverse(field):
+        return field[1:] if field.startswith('-') else '-' + field
+
+    @staticmethod
+    def _After(ordering, position):
+
+        # (a, b) > (x, y)  =>  a > x or (a = x and b > y), with each field's own direction
+        condition   = Q()
+        equal       = Q()
+        for field, value in zip(ordering, position):
+            name    = field.lstrip('-')
+            lookup  = '__lt' if field.startswith('-') else '__gt'
+            condition |= equal & Q(**{name + lookup: value})
+            equal &= Q(**{name: value})
+
+        return condition
+
+
+def estimate_count(queryset):
+
+    # row count from the postgresql planner: the table statistics when the queryset
+    # isn't filtered, the plan estimate otherwise. none on other databases
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return None
+
+    with connection.cursor() as cursor:
+
+        if not queryset.query.where:
+            cursor.execute('SELECT reltuples FROM pg_class WHERE oid = %s::regclass', [queryset.model._meta.db_table])
+            row = cursor.fetchone()
+            # -1 or 0 for a table never analyzed
+            return int(row[0]) if row and row[0] > 0 else None
+
+        sql, params = queryset.order_by().query.sql_with_params()
+        cursor.execute('EXPLAIN (FORMAT JSON) ' + sql, params)
+        plan = cursor.fetchone()[0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+
+        return int(plan[0]['Plan']['Plan Rows'])
+
+
+class CountPaginator(DjangoPaginator):
+
+    # counts count_queryset instead of the paged queryset when one is given
+    def __init__(self, object_list, per_page, count_queryset=None, **kwargs):
+
+        super().__init__(object_list, per_page, **kwargs)
+        self.count_queryset = count_queryset
+
+    @cached_property
+    def count(self):
+
+        if self.count_queryset is None:
+            return super().count
+
+        return self.count_queryset.count()
+
+
+class Pagination(PageNumberPagination):
+
+    # page number pagination unless the client asks for keyset pages with ?cursor=
+    # (empty cursor for the first page).
+    #
+    # views can set count_queryset to have the total counted on another queryset
+    # than the page, e.g. the filtered rows without the columns of the page query
+    #
+    # ?count= picks how the total is computed: exact (default) runs COUNT(*), none
+    # skips it and fetches one extra row to know if there's a next page, estimate
+    # reports the planner estimate and only counts when it's small enough to be cheap
+
+    cursor_query_param  = KeysetPagination.cursor_query_param
+    count_query_param   = 'count'
+    estimate_threshold  = 10000
+
+    def paginate_queryset(self, queryset, request, view=None):
+
+        self.keyset = None
+        if self.cursor_query_param in request.query_params:
+            self.keyset = KeysetPagination()
+            return self.keyset.paginate_queryset(queryset, request, view)
+
+        count_queryset = getattr(view, 'count_queryset', None)
+        if count_queryset is None:
+            count_queryset = queryset
+        self.django_paginator_class = functools.partial(CountPaginator, count_queryset=count_queryset)
+
+        self.count_mode = request.query_params.get(self.count_query_param)
+        if self.count_mode not in ('none', 'estimate'):
+            self.count_mode = None
+            return super().paginate_queryset(queryset, request, view)
+
+        page_size = self.get_page_size(request)
+        try:
+            self.page_number = int(request.query_params.get(self.page_query_param, 1))
+        except ValueError:
+            raise NotFound(self.invalid_page_message)
+        if self.page_number < 1:
+            raise NotFound(self.invalid_page_message)
+
+        offset      = (self.page_number - 1) * page_size
+        results     = list(queryset[offset:offset + page_size + 1])
+        if not results and self.page_number > 1:
+            raise NotFound(self.invalid_page_message)
+
+        self.request    = request
+        self.has_next   = len(results) > page_size
+        self.count      = None
+        self.estimated  = False
+
+        if self.count_mode == 'estimate':
+            self.count = estimate_count(count_queryset)
+            self.estimated = self.count is not None and self.count >= self.estimate_threshold
+            if not self.estimated:
+                self.count = count_queryset.count()
+
+        return results[:page_size]
+
+    def get_next_link(self):
+
+        if not self.count_mode:
+            return super().get_next_link()
+
+        if not self.has_next:
+            return None
+
+        return replace_query_param(self.request.build_absolute_uri(), self.page_query_param, self.page_number + 1)
+
+    def get_previous_link(self):
+
+        if not self.count_mode:
+            return super().get_previous_link()
+
+        if self.page_number == 1:
+            return None
+
+        url = self.request.build_absolute_uri()
+        if self.page_number == 2:
+            return remove_query_param(url, self.page_query_param)
+
+        return replace_query_param(url, self.page_query_param, self.page_number - 1)
+
+    def get_paginated_response(self, data):
+
+        if self.keyset:
+            return self.keyset.get_paginated_response(data)
+
+        if self.count_mode == 'none':
+            return Response(OrderedDict([
+                ('next', self.get_next_link()),
+                ('previous', self.get_previous_link()),
+                ('results', data)
+            ]))
+
+        if self.count_mode == 'estimate':
+            return Response(OrderedDict([
+                ('count', self.count),
+                ('estimated', self.estimated),
+                ('next', self.get_next_link()),
+                ('previous', self.get_previous_link()),
+                ('results', data)
+            ]))
+
+        return super().get_paginated_response(data)
@@ -9,8 +9,29 @@ https://docs.djangoproject.com/en/3.1/howto/deployment/asgi/
 
 import os
 
+from asgiref.wsgi import WsgiToAsgi
 from django.core.asgi import get_asgi_application
+from django.core.wsgi import get_wsgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'soccer.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# streamed bodies that read the database as they go, run in a thread
+export_application = WsgiToAsgi(get_wsgi_application())
+
+# imported once django is set up
+from soccer_manager.api import events, export
+
+
+async def application(scope, receive, send):
+
+    # the market list event stream is a long lived response, served here instead of
+    # holding a django worker thread per subscriber
+    if scope['type'] == 'http' and scope['path'] == events.PATH:
+        return await events.market_events(scope, receive, send)
+
+    if scope['type'] == 'http' and scope['path'].startswith(export.PATHS):
+        return await export_application(scope, receive, send)
+
+    return await django_application(scope, receive, send)
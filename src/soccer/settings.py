@@ -63,7 +63,7 @@ INSTALLED_APPS = [
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'accounts.authentication.ClaimsJWTAuthentication',
     ),
 
     'DEFAULT_PERMISSION_CLASSES': [
@@ -74,7 +74,7 @@ REST_FRAMEWORK = {
         'django_filters.rest_framework.DjangoFilterBackend',      
     ),
 
-    'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
+    'DEFAULT_PAGINATION_CLASS': 'common.pagination.Pagination',
     'PAGE_SIZE': 10,        
 
     'EXCEPTION_HANDLER': 'soccer.custom_handlers.custom_exception_handler',
@@ -197,6 +197,58 @@ SIMPLE_JWT = {
     'SLIDING_TOKEN_REFRESH_LIFETIME': timedelta(days=1),
 }
 
+# Team pool
+# teams generated ahead of time and handed to new users on first login (see fill_team_pool)
+
+TEAM_POOL_SIZE = int(os.environ.get('TEAM_POOL_SIZE', 100))
+
+
+# Cache
+# https://docs.djangoproject.com/en/3.1/topics/cache/
+# local memory per process unless a shared backend is configured, e.g.
+# CACHE_BACKEND=django.core.cache.backends.memcached.PyLibMCCache CACHE_LOCATION=127.0.0.1:11211
+
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('CACHE_LOCATION', 'soccer-manager'),
+    }
+}
+
+# market list and team responses (see soccer_manager/cache.py). the version counters
+# expire with the responses: with the default LocMemCache each process has its own and
+# sees the writes of the others after RESPONSE_CACHE_TIMEOUT, a shared backend (redis,
+# memcached) sees them right away
+RESPONSE_CACHE          = 'default'
+RESPONSE_CACHE_TIMEOUT  = int(os.environ.get('RESPONSE_CACHE_TIMEOUT', 30))
+RESPONSE_CACHE_STALE    = int(os.environ.get('RESPONSE_CACHE_STALE', 30))
+
+
+# Market list event stream (see soccer_manager/api/events.py)
+
+MARKET_EVENTS_BUFFER    = 1000  # events kept for clients resuming with Last-Event-ID
+MARKET_EVENTS_QUEUE     = 100   # events waiting for a slow client before its stream is closed
+MARKET_EVENTS_KEEPALIVE = 15    # seconds between keepalive comments on an idle stream
+
+
+# Streaming exports (see soccer_manager/api/export.py)
+
+EXPORT_CHUNK_SIZE       = 2000  # rows fetched from the cursor and serialized at a time
+
+
+# Claims authentication (see accounts/authentication.py)
+
+AUTH_STATE_TTL          = 30    # seconds an account state (active, revoked) is trusted without reading it again
+AUTH_STATE_SIZE         = 10000 # account states kept per process
+
+# expired outstanding and blacklisted tokens deleted per statement by prune_tokens
+TOKEN_PRUNE_BATCH_SIZE  = 1000
+
+
+# Team leaderboard (see soccer_manager/leaderboard.py)
+
+LEADERBOARD_RELOAD      = 300   # seconds before the in-memory rankings are reloaded from the database
+
 
 # Internationalization
 # https://docs.djangoproject.com/en/3.1/topics/i18n/
@@ -0,0 +1,80 @@
+import hashlib
+
+from django.core.exceptions import ImproperlyConfigured
+from django.utils.http import http_date, parse_http_date_safe, quote_etag
+from rest_framework import status
+from rest_framework.response import Response
+
+from soccer_manager import cache as response_cache
+
+
+class ConditionalGetMixin():
+
+    # ETag and Last-Modified for GET responses, made from the version counters of
+    # soccer_manager.cache instead of the rendered body. views list the versions their
+    # response depends on in get_validator_keys(). an unchanged list is answered with
+    # 304 before its query, an unchanged object right after the permission check.
+    # fixed keys go in validator_keys, keys depending on the request in an override
+
+    validator_keys = ()
+
+    def __init_subclass__(cls, **kwargs):
+
+        # without keys the etag never changes and every conditional request gets a 304
+        super().__init_subclass__(**kwargs)
+        if not cls.validator_keys and cls.get_validator_keys is ConditionalGetMixin.get_validator_keys:
+            raise ImproperlyConfigured(f'{cls.__name__} must set validator_keys or override get_validator_keys().')
+
+    def get_validator_keys(self):
+        return list(self.validator_keys)
+
+    def GetValidators(self, request):
+
+        if not hasattr(self, '_validators'):
+            versions, modified = response_cache.get_validators(*self.get_validator_keys())
+
+            # the body also depends on the url, the user and the format
+            tag = hashlib.md5(
+                f'{self.__class__.__name__}|{versions}|{request.get_full_path()}|{request.user.id}|{request.accepted_media_type}'.encode()
+                ).hexdigest()
+            self._validators = ('W/' + quote_etag(tag), int(modified))
+
+        return self._validators
+
+    def NotModified(self, request):
+
+        etag, modified = self.GetValidators(request)
+
+        if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+        if if_none_match is not None:
+            tags = [tag.strip() for tag in if_none_match.split(',')]
+            unchanged = '*' in tags or etag in tags or etag[2:] in tags
+        else:
+            since = parse_http_date_safe(request.META.get('HTTP_IF_MODIFIED_SINCE', ''))
+            unchanged = since is not None and modified <= since
+
+        if not unchanged:
+            return None
+
+        return Response(status=status.HTTP_304_NOT_MODIFIED)
+
+    def list(self, request, *args, **kwargs):
+        return self.NotModified(request) or super().list(request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+
+        # versions read before the row, a write landing in between can only make the
+        # etag older than the body, never newer
+        self.GetValidators(request)
+        instance = self.get_object()
+        return self.NotModified(request) or Response(self.get_serializer(instance).data)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+
+        response = super().finalize_response(request, response, *args, **kwargs)
+        if request.method in ('GET', 'HEAD') and response.status_code in (200, 304):
+            etag, modified = self.GetValidators(request)
+            response['ETag'] = etag
+            response['Last-Modified'] = http_date(modified)
+
+        return response
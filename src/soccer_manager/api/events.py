@@ -0,0 +1,178 @@
+import asyncio
+import json
+
+from decimal import Decimal
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import QueryDict
+from rest_framework.exceptions import APIException
+
+from accounts.authentication import ClaimsJWTAuthentication
+from soccer_manager import events
+from soccer_manager.models import MarketList
+from .filters import MarketListFilter
+
+# server-sent events stream of the market list, served by soccer/asgi.py next to the
+# django application. it takes the MarketListFilter parameters and resumes from the
+# Last-Event-ID header (or ?last_event_id=). an idle subscriber is a queue and a
+# waiting coroutine, no thread.
+#
+# browsers' EventSource can't send headers, the access token can come as ?token=
+
+PATH = '/api/soccer-manager/marketlist/events/'
+
+# event fields of the MarketListFilter field names
+EVENT_FIELDS = {
+    'player__first_name': 'first_name',
+    'player__last_name': 'last_name',
+    'player__team__name': 'team_name',
+}
+
+LOOKUPS = {
+    'exact': lambda value, wanted: value == wanted,
+    'startswith': lambda value, wanted: str(value).startswith(wanted),
+    'gte': lambda value, wanted: value >= wanted,
+    'lte': lambda value, wanted: value <= wanted,
+}
+
+
+def _NameTest(terms):
+    return lambda data: all(data['first_name'].startswith(term) or data['last_name'].startswith(term) for term in terms)
+
+def _SearchTest(terms):
+
+    terms = [term.lower() for term in terms]
+    return lambda data: all(
+        any(data[field].lower().startswith(term) for field in ('first_name', 'last_name', 'team_name')) for term in terms)
+
+METHOD_TESTS = {
+    'name_filter': _NameTest,
+    'search_filter': _SearchTest,
+}
+
+
+def build_matcher(params):
+
+    # the same parameters, validated by the same form as GET /marketlist/
+    filterset = MarketListFilter(data=params, queryset=MarketList.objects.none())
+    if not filterset.is_valid():
+        return None, filterset.errors
+
+    tests = []
+    for name, value in filterset.form.cleaned_data.items():
+        if value in (None, ''):
+            continue
+
+        field = filterset.filters[name]
+        if field.method:
+            tests.append(METHOD_TESTS[field.method](value.split()))
+            continue
+
+        key     = EVENT_FIELDS.get(field.field_name, field.field_name)
+        lookup  = LOOKUPS[field.lookup_expr]
+        wanted  = float(value) if isinstance(value, Decimal) else value
+        tests.append(lambda data, key=key, lookup=lookup, wanted=wanted: lookup(data[key], wanted))
+
+    return (lambda data: all(test(data) for test in tests)), None
+
+def _Authenticate(raw_token):
+
+    authentication = ClaimsJWTAuthentication()
+    return authentication.get_user(authentication.get_validated_token(raw_token))
+
+def _Format(event_type, data, event_id=None):
+
+    lines = [] if event_id is None else [f'id: {event_id}']
+    lines += [f'event: {event_type}', f'data: {json.dumps(data)}', '', '']
+    return '\n'.join(lines).encode()
+
+async def _Respond(send, status, data):
+
+    await send({'type': 'http.response.start', 'status': status, 'headers': [(b'content-type', b'application/json')]})
+    await send({'type': 'http.response.body', 'body': json.dumps(data).encode()})
+
+async def _WaitDisconnect(receive):
+
+    while (await receive())['type'] != 'http.disconnect':
+        pass
+
+async def market_events(scope, receive, send):
+
+    if scope['method'] != 'GET':
+        return await _Respond(send, 405, {'detail': f'Method "{scope["method"]}" not allowed.'})
+
+    headers = dict(scope['headers'])
+    params  = QueryDict(scope['query_string'])
+
+    raw_token = params.get('token')
+    authorization = headers.get(b'authorization', b'').split()
+    if len(authorization) == 2 and authorization[0].decode() in settings.SIMPLE_JWT['AUTH_HEADER_TYPES']:
+        raw_token = authorization[1].decode()
+
+    if not raw_token:
+        return await _Respond(send, 401, {'detail': 'Authentication credentials were not provided.'})
+    try:
+        await sync_to_async(_Authenticate)(raw_token)
+    except APIException as exc:
+        return await _Respond(send, 401, exc.detail)
+
+    matches, errors = build_matcher(params)
+    if errors:
+        return await _Respond(send, 400, errors)
+
+    last_id = headers.get(b'last-event-id') or params.get('last_event_id')
+    try:
+        last_id = int(last_id) if last_id else None
+    except ValueError:
+        return await _Respond(send, 400, {'detail': 'Invalid last event id.'})
+
+    await sync_to_async(events.listen)()
+
+    queue = asyncio.Queue()
+    subscription, backlog, missed = events.broker.Subscribe(
+        asyncio.get_running_loop(), queue, settings.MARKET_EVENTS_QUEUE, last_id)
+
+    disconnect  = asyncio.ensure_future(_WaitDisconnect(receive))
+    get         = None
+    try:
+        await send({'type': 'http.response.start', 'status': 200, 'headers': [
+            (b'content-type', b'text/event-stream'),
+            (b'cache-control', b'no-cache'),
+            (b'x-accel-buffering', b'no'),
+        ]})
+
+        # events after last_id left the buffer or last_id is unknown, the client has to reload the list
+        if missed:
+            await send({'type': 'http.response.body', 'body': _Format('reset', {}), 'more_body': True})
+
+        for event in backlog:
+            if matches(event['data']):
+                await send({'type': 'http.response.body', 'body': _Format(event['event'], event['data'], event['id']), 'more_body': True})
+
+        while True:
+
+            get = get or asyncio.ensure_future(queue.get())
+            done, _ = await asyncio.wait({get, disconnect}, timeout=settings.MARKET_EVENTS_KEEPALIVE, return_when=asyncio.FIRST_COMPLETED)
+
+            if disconnect in done:
+                return
+
+            if get not in done:
+                await send({'type': 'http.response.body', 'body': b': keepalive\n\n', 'more_body': True})
+                continue
+
+            event, get = get.result(), None
+            if event is None:
+                break
+
+            if matches(event['data']):
+                await send({'type': 'http.response.body', 'body': _Format(event['event'], event['data'], event['id']), 'more_body': True})
+
+        await send({'type': 'http.response.body', 'body': b''})
+
+    finally:
+        events.broker.Unsubscribe(subscription)
+        disconnect.cancel()
+        if get is not None:
+            get.cancel()
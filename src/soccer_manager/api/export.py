@@ -0,0 +1,96 @@
+import csv
+import itertools
+
+from django.conf import settings
+from django.http import StreamingHttpResponse
+from rest_framework.exceptions import NotFound
+from rest_framework.utils.encoders import JSONEncoder
+
+from .rows import row_serializer
+
+# csv and ndjson exports of the player, team and market lists. rows come from a
+# server-side cursor (queryset.iterator) and are serialized by the compiled
+# RowSerializer EXPORT_CHUNK_SIZE at a time while the response is sent, memory
+# doesn't grow with the number of rows. the filters of the list views apply.
+#
+# django's asgi handler iterates a streaming body on the event loop, where queries
+# can't run. soccer/asgi.py serves these paths through the wsgi handler in a thread
+
+PATHS = tuple(f'/api/soccer-manager/{name}/export/' for name in ('players', 'teams', 'marketlist'))
+
+
+class _Echo():
+
+    # csv.writer target, the line is returned instead of buffered
+    def write(self, value):
+        return value
+
+
+def _Chunks(rows, size):
+
+    rows = iter(rows)
+    while True:
+        chunk = list(itertools.islice(rows, size))
+        if not chunk:
+            return
+        yield chunk
+
+def _Header(mappers, prefix=''):
+
+    # nested serializers are flattened to player.first_name, player.last_name...
+    header = []
+    for name, index, convert in mappers:
+        if index is None:
+            header += _Header(convert, prefix + name + '.')
+        else:
+            header.append(prefix + name)
+
+    return header
+
+def _Flatten(data, values):
+
+    for value in data.values():
+        if isinstance(value, dict):
+            _Flatten(value, values)
+        else:
+            values.append(value)
+
+    return values
+
+def _Csv(serializer, rows, size):
+
+    writer = csv.writer(_Echo())
+    yield writer.writerow(_Header(serializer.mappers))
+
+    for chunk in _Chunks(rows, size):
+        yield ''.join(writer.writerow(_Flatten(data, [])) for data in serializer.Serialize(chunk))
+
+def _Ndjson(serializer, rows, size):
+
+    encoder = JSONEncoder()
+    for chunk in _Chunks(rows, size):
+        yield ''.join(encoder.encode(data) + '\n' for data in serializer.Serialize(chunk))
+
+FORMATS = {
+    'csv': ('text/csv', _Csv),
+    'ndjson': ('application/x-ndjson', _Ndjson),
+}
+
+
+class ExportMixin():
+
+    export_name = None
+
+    def get(self, request, export_format):
+
+        if export_format not in FORMATS:
+            raise NotFound(f'Unknown export format: {export_format}.')
+
+        content_type, write = FORMATS[export_format]
+        size        = settings.EXPORT_CHUNK_SIZE
+        serializer  = row_serializer(self.get_serializer_class())
+        rows        = serializer.Read(self.filter_queryset(self.get_queryset())).iterator(chunk_size=size)
+
+        response = StreamingHttpResponse(write(serializer, rows, size), content_type=content_type)
+        response['Content-Disposition'] = f'attachment; filename="{self.export_name}.{export_format}"'
+        return response
@@ -1,16 +1,24 @@
-from django.db.models import Q
+from django.db import connection
+from django.db.models import Q, Value
+from django.db.models.functions import Concat, Greatest
 from django_filters import rest_framework as filters
 from ..models import MarketList
 
 class MarketListFilter(filters.FilterSet):
-    
+
     first_name  = filters.CharFilter(field_name='player__first_name', lookup_expr='startswith')
     last_name   = filters.CharFilter(field_name='player__last_name', lookup_expr='startswith')
     name        = filters.CharFilter(method='name_filter')
-    country     = filters.CharFilter(field_name='player__country')
+    search      = filters.CharFilter(method='search_filter')
+    country     = filters.CharFilter(field_name='country')
+    position    = filters.CharFilter(field_name='position')
     team_name   = filters.CharFilter(field_name='player__team__name', lookup_expr='startswith')
-    min_value   = filters.NumberFilter(field_name="player__market_value", lookup_expr='gte')
-    max_value   = filters.NumberFilter(field_name="player__market_value", lookup_expr='lte')
+    min_value   = filters.NumberFilter(field_name="market_value", lookup_expr='gte')
+    max_value   = filters.NumberFilter(field_name="market_value", lookup_expr='lte')
+    min_price   = filters.NumberFilter(field_name="asked_price", lookup_expr='gte')
+    max_price   = filters.NumberFilter(field_name="asked_price", lookup_expr='lte')
+    min_age     = filters.NumberFilter(field_name="age", lookup_expr='gte')
+    max_age     = filters.NumberFilter(field_name="age", lookup_expr='lte')
 
     class Meta:
         model = MarketList
@@ -18,18 +26,51 @@ class MarketListFilter(filters.FilterSet):
             'first_name',
             'last_name',
             'country',
+            'position',
             'team_name',
             'min_value',
             'max_value',
+            'min_price',
+            'max_price',
+            'min_age',
+            'max_age',
         ]
 
-    def name_filter(self, queyset, name, value):
-        q = MarketList.objects.all()
+    def name_filter(self, queryset, name, value):
         for term in value.split():
-            q = q.filter(
-                Q(player__first_name__startswith=term) | 
+            queryset = queryset.filter(
+                Q(player__first_name__startswith=term) |
                 Q(player__last_name__startswith=term)
                 )
-        
-        return q
 
+        return queryset
+
+    def search_filter(self, queryset, name, value):
+
+        # every term must prefix the player first name, last name or team name. on
+        # postgresql the prefixes hit the trigram indexes and the results are ranked
+        # by similarity with the whole search, other databases keep the default order.
+        # the rank isn't a keyset column, the market list refuses ?cursor= with a search
+        terms = value.split()
+        if not terms:
+            return queryset
+
+        for term in terms:
+            queryset = queryset.filter(
+                Q(player__first_name__istartswith=term) |
+                Q(player__last_name__istartswith=term) |
+                Q(player__team__name__istartswith=term)
+                )
+
+        if connection.vendor != 'postgresql':
+            return queryset
+
+        from django.contrib.postgres.search import TrigramSimilarity
+
+        search = ' '.join(terms)
+        return queryset.annotate(
+            search_rank=Greatest(
+                TrigramSimilarity(Concat('player__first_name', Value(' '), 'player__last_name'), search),
+                TrigramSimilarity('player__team__name', search),
+                )
+            ).order_by('-search_rank', 'id')
@@ -1,5 +1,20 @@
-from rest_framework.permissions import BasePermission
+from rest_framework.permissions import SAFE_METHODS, BasePermission
 
+from soccer_manager.models import Team
+
+
+def get_team_id(request):
+
+    # id of the team of the request user, None without a team. read once per request
+    # and shared by the permissions and the views. reads take it from a claims user,
+    # writes from the database: the account state a claims user comes from only sees
+    # an ownership change made in another process after AUTH_STATE_TTL
+    if not hasattr(request, '_team_id'):
+        request._team_id = request.user.__dict__.get('team_id', None) if request.method in SAFE_METHODS else None
+        if request._team_id is None:
+            request._team_id = Team.objects.filter(owner_id = request.user.id).values_list('id', flat=True).first()
+
+    return request._team_id
 
 class IsPlayerOwner(BasePermission):
 
@@ -7,7 +22,7 @@ class IsPlayerOwner(BasePermission):
         if request.user.is_admin:
             return True
         else:
-            return obj.team.owner == request.user
+            return obj.team_id == get_team_id(request)
 
 class IsTeamOwner(BasePermission):
 
@@ -15,4 +30,4 @@ class IsTeamOwner(BasePermission):
         if request.user.is_admin:
             return True
         else:
-            return obj.owner == request.user
\ No newline at end of file
+            return obj.owner_id == request.user.id
\ No newline at end of file
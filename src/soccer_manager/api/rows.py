@@ -0,0 +1,188 @@
+import functools
+
+from django.core.exceptions import ImproperlyConfigured
+from rest_framework import ISO_8601
+from rest_framework import fields as drf_fields
+from rest_framework.relations import PrimaryKeyRelatedField
+from rest_framework.response import Response
+from rest_framework.serializers import BaseSerializer, ListSerializer
+from rest_framework.settings import api_settings
+
+# read path for the list endpoints. a ModelSerializer class is compiled once into
+# the values_list columns it reads and one converter per field, then pages are read
+# as named tuples and turned into dicts without binding a serializer to each row.
+# the output is the same as serializer(rows, many=True).data
+
+
+def _Identity(value):
+    return value
+
+def _DateTimeConverter(field):
+
+    output_format = getattr(field, 'format', api_settings.DATETIME_FORMAT)
+    if output_format is None or output_format.lower() != ISO_8601:
+        return field.to_representation
+
+    timezone = field.timezone if hasattr(field, 'timezone') else field.default_timezone()
+
+    def convert(value):
+        if timezone is not None and value.tzinfo is not None:
+            value = value.astimezone(timezone)
+        value = value.isoformat()
+        return value[:-6] + 'Z' if value.endswith('+00:00') else value
+
+    return convert
+
+def _ChoiceConverter(field):
+
+    choices = field.choice_strings_to_values
+    return lambda value: value if value == '' else choices.get(str(value), value)
+
+def _Converter(field):
+
+    # most specific first, ChoiceField and friends subclass the basic fields
+    if isinstance(field, PrimaryKeyRelatedField) and field.pk_field is None:
+        return _Identity
+    if isinstance(field, drf_fields.ChoiceField):
+        return _ChoiceConverter(field)
+    if isinstance(field, drf_fields.DateTimeField):
+        return _DateTimeConverter(field)
+    if type(field) is drf_fields.CharField:
+        return str
+    if type(field) is drf_fields.IntegerField:
+        return int
+    if type(field) is drf_fields.FloatField:
+        return float
+
+    raise ImproperlyConfigured(f'No row converter for {type(field).__name__} {field.field_name}.')
+
+
+class _Related():
+
+    # a reverse relation serialized as a list. the related rows of a whole page are
+    # read with one query and grouped by their foreign key
+    __slots__ = ('serializer', 'queryset', 'lookup', 'key')
+
+    def __init__(self, serializer, relation):
+
+        self.serializer = RowSerializer(serializer.child)
+        self.queryset   = relation.model._default_manager.all()
+        self.lookup     = relation.name + '__in'
+        self.key        = self.serializer._Column(relation.attname)
+
+    def Fetch(self, ids):
+
+        rows    = list(self.serializer.Read(self.queryset.filter(**{self.lookup: ids})))
+        grouped = {}
+        for row, data in zip(rows, self.serializer.Serialize(rows)):
+            grouped.setdefault(row[self.key], []).append(data)
+
+        return lambda pk: grouped.get(pk, [])
+
+
+class RowSerializer():
+
+    __slots__ = ('columns', 'mappers', 'related')
+
+    def __init__(self, serializer):
+
+        self.columns = []
+        self.related = False
+        self.mappers = self._Compile(serializer, '')
+
+    def _Column(self, column):
+
+        if column not in self.columns:
+            self.columns.append(column)
+        return self.columns.index(column)
+
+    def _Compile(self, serializer, prefix):
+
+        mappers = []
+        for name, field in serializer.fields.items():
+            if field.write_only:
+                continue
+
+            source = prefix + field.source.replace('.', '__')
+            if isinstance(field, ListSerializer):
+                if prefix:
+                    raise ImproperlyConfigured(f'Nested list {field.field_name} is only read at the top level.')
+                model = serializer.Meta.model
+                self.related = True
+                mappers.append((name, self._Column(model._meta.pk.attname), _Related(field, getattr(model, source).field)))
+            elif isinstance(field, BaseSerializer):
+                mappers.append((name, None, self._Compile(field, source + '__')))
+            else:
+                mappers.append((name, self._Column(source), _Converter(field)))
+
+        return tuple(mappers)
+
+    def Read(self, queryset, *extra_columns):
+
+        # extra columns are read but not serialized, keyset pagination needs the sort fields
+        columns = self.columns + [column for column in extra_columns if column not in self.columns]
+        return queryset.values_list(*columns, named=True)
+
+    def Serialize(self, rows):
+
+        build = self._Build
+        mappers = self.mappers
+        if self.related:
+            rows    = list(rows)
+            mappers = self._Fetch(mappers, rows)
+
+        return [build(mappers, row) for row in rows]
+
+    @staticmethod
+    def _Fetch(mappers, rows):
+
+        # related lists of these rows, the converter of their mapper looks them up
+        fetched = []
+        for name, index, convert in mappers:
+            if isinstance(convert, _Related):
+                convert = convert.Fetch({row[index] for row in rows}) if rows else (lambda pk: [])
+            fetched.append((name, index, convert))
+
+        return tuple(fetched)
+
+    @classmethod
+    def _Build(cls, mappers, row):
+
+        data = {}
+        for name, index, convert in mappers:
+            if index is None:
+                data[name] = cls._Build(convert, row)
+            else:
+                value = row[index]
+                data[name] = None if value is None else convert(value)
+
+        return data
+
+
+@functools.lru_cache(maxsize=512)
+def row_serializer(serializer_class):
+    return RowSerializer(serializer_class())
+
+
+class RowListMixin():
+
+    # GET lists built by the compiled RowSerializer of the view serializer class
+
+    def GetReadSerializerClass(self):
+        return self.get_serializer_class()
+
+    def list(self, request, *args, **kwargs):
+
+        serializer      = row_serializer(self.GetReadSerializerClass())
+        keyset_fields   = list(getattr(self, 'keyset_ordering_fields', {}).values())
+        filtered        = self.filter_queryset(self.get_queryset())
+        queryset        = serializer.Read(filtered, 'id', *keyset_fields)
+
+        # counted without the columns, they would bring their joins into the COUNT(*)
+        self.count_queryset = filtered
+
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(serializer.Serialize(page))
+
+        return Response(serializer.Serialize(queryset))
@@ -1,3 +1,4 @@
+from soccer_manager import leaderboard
 from soccer_manager.models import Player, Team, MarketList
 from rest_framework import serializers
 
@@ -38,24 +39,50 @@ class PlayerMarketListUserSerializer(serializers.ModelSerializer):
             ]
          
 
-class TeamAdminUserSerializer(serializers.ModelSerializer):
+class TeamSerializer(serializers.ModelSerializer):
 
+    def update(self, instance, validated_data):
+
+        # only the fields sent are written. budget and value move with F() updates in
+        # purchases, a full save would write back what was read before them
+        for name, value in validated_data.items():
+            setattr(instance, name, value)
+        instance.save(update_fields = list(validated_data))
+
+        return instance
+
+class TeamAdminUserSerializer(TeamSerializer):
+
+    # a team without owner is out of the game, admins can't create or leave one
     class Meta:
         model = Team
-        fields = '__all__'
+        exclude = ['pooled']
         read_only_fields = ['created']
+        extra_kwargs = {'owner': {'required': True, 'allow_null': False}}
 
-class TeamNormalUserSerializer(serializers.ModelSerializer):
+class TeamNormalUserSerializer(TeamSerializer):
 
     class Meta:
         model = Team
-        fields = '__all__'
+        exclude = ['pooled']
         read_only_fields = [
             'value',
             'budget',
             'owner'
         ]
 
+class TeamLeaderboardSerializer(serializers.Serializer):
+
+    by      = serializers.ChoiceField(choices=leaderboard.FIELDS, default='value')
+    limit   = serializers.IntegerField(min_value=1, max_value=100, default=10)
+    offset  = serializers.IntegerField(min_value=0, default=0)
+
+    class Meta:        
+        fields = [
+            'by',
+            'limit',
+            'offset',
+        ]    
 
 class MarketListPutPlayerSerializer(serializers.Serializer):
 
@@ -68,6 +95,26 @@ class MarketListPutPlayerSerializer(serializers.Serializer):
             'asked_price'
         ]    
 
+class MarketListBulkPutPlayerSerializer(serializers.Serializer):
+
+    players = serializers.ListField(child=MarketListPutPlayerSerializer(), allow_empty=False, max_length=100)
+
+    class Meta:        
+        fields = [
+            'players',
+        ]    
+
+class MarketListBuyPlayersSerializer(serializers.Serializer):
+
+    team    = serializers.PrimaryKeyRelatedField(queryset=Team.objects.all(), required=False) # the user team by default
+    players = serializers.ListField(child=serializers.IntegerField(), allow_empty=False, max_length=100)
+
+    class Meta:        
+        fields = [
+            'team',
+            'players',
+        ]    
+
 class MarketListDetailSerializer(serializers.ModelSerializer):
     
     player = PlayerMarketListUserSerializer()
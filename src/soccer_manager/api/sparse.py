@@ -0,0 +1,134 @@
+import functools
+
+from django.db.models.fields.related_descriptors import ReverseManyToOneDescriptor
+from rest_framework.exceptions import ValidationError
+
+# sparse fieldsets and expansions for GET responses.
+#
+# ?fields=id,name keeps only those fields of the serializer class the view picked
+# (by permission), and only their columns are read: the list rows select them and
+# a detail query defers the others. ?expand= embeds related objects where their id
+# would be. views list their expansions in expandable_fields,
+# {name: (model attribute, serializer class of a user, version key)}, and override
+# GetExpandableFields() to hide the ones a user can't see. a forward relation is
+# joined, a reverse one is read with one query for the whole page (one prefetch for
+# a detail), without filters: an expansion must only be offered where the user may
+# see every related object. expanded fields are always in the output
+
+
+def _Names(value):
+    return [name.strip() for name in (value or '').split(',') if name.strip()]
+
+@functools.lru_cache(maxsize=None)
+def _FieldNames(serializer_class):
+    return tuple(serializer_class().fields)
+
+@functools.lru_cache(maxsize=256)
+def sparse_serializer(serializer_class, fields, expansions):
+
+    # fields is a tuple of field names or None for all of them, expansions a tuple of
+    # (name, model attribute, serializer class, many)
+    expanded    = [name for name, _, _, _ in expansions]
+    order       = [name for name in _FieldNames(serializer_class) if fields is None or name in fields or name in expanded]
+    order      += [name for name in expanded if name not in order]
+
+    def get_fields(self):
+        all_fields = serializer_class.get_fields(self)
+        return {name: all_fields[name] for name in order}
+
+    attrs = {'get_fields': get_fields}
+    for name, source, expanded_class, many in expansions:
+        attrs[name] = expanded_class(many=many, read_only=True, **({} if source == name else {'source': source}))
+
+    return type(serializer_class)('Sparse' + serializer_class.__name__, (serializer_class,), attrs)
+
+
+class SparseFieldsMixin():
+
+    expandable_fields = {}
+
+    def GetExpandableFields(self):
+        return self.expandable_fields
+
+    def GetSparseParams(self):
+
+        # (field names or None, expansion names), validated once per request
+        if not hasattr(self, '_sparse_params'):
+
+            params = self.request.query_params
+            fields = _Names(params.get('fields')) if 'fields' in params else None
+            expand = _Names(params.get('expand'))
+
+            expandable = self.GetExpandableFields()
+            unknown = [name for name in expand if name not in expandable]
+            if unknown:
+                raise ValidationError({'expand': [f'Unknown expansion: {name}.' for name in unknown]})
+
+            if fields is not None:
+                known   = set(_FieldNames(self.get_serializer_class())) | set(expandable)
+                unknown = [name for name in fields if name not in known]
+                if unknown:
+                    raise ValidationError({'fields': [f'Unknown field: {name}.' for name in unknown]})
+
+            self._sparse_params = (fields, expand)
+
+        return self._sparse_params
+
+    def _Sparse(self):
+        return self.request.method in ('GET', 'HEAD') and self.GetSparseParams() != (None, [])
+
+    def GetExpansionKeys(self):
+
+        # an expanded response also changes with the related objects
+        if self.request.method not in ('GET', 'HEAD'):
+            return []
+
+        return [self.GetExpandableFields()[name][2] for name in self.GetSparseParams()[1]]
+
+    def GetReadSerializerClass(self):
+
+        serializer_class = self.get_serializer_class()
+        if not self._Sparse():
+            return serializer_class
+
+        fields, expand  = self.GetSparseParams()
+        model           = serializer_class.Meta.model
+        expansions      = []
+        for name in expand:
+            source, get_class, _ = self.GetExpandableFields()[name]
+            many = isinstance(getattr(model, source), ReverseManyToOneDescriptor)
+            expansions.append((name, source, get_class(self.request.user), many))
+
+        # normalized, the same request always gets the same class
+        if fields is not None:
+            fields = tuple(sorted(set(fields)))
+        return sparse_serializer(serializer_class, fields, tuple(expansions))
+
+    def get_serializer(self, *args, **kwargs):
+
+        kwargs.setdefault('context', self.get_serializer_context())
+        return self.GetReadSerializerClass()(*args, **kwargs)
+
+    def get_queryset(self):
+
+        queryset = super().get_queryset()
+
+        # lists read their columns through RowSerializer, only a detail is shaped here
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        if lookup_url_kwarg not in self.kwargs or not self._Sparse():
+            return queryset
+
+        fields, expand = self.GetSparseParams()
+        for name in expand:
+            source = self.GetExpandableFields()[name][0]
+            if isinstance(getattr(queryset.model, source), ReverseManyToOneDescriptor):
+                queryset = queryset.prefetch_related(source)
+            else:
+                queryset = queryset.select_related(source)
+
+        # relations stay, the object permissions read them
+        if fields is not None:
+            queryset = queryset.only(*[
+                field.name for field in queryset.model._meta.concrete_fields if field.name in fields or field.is_relation])
+
+        return queryset
@@ -8,12 +8,23 @@ urlpatterns = [
     # players
     path('players/', views.PlayerListCreateAPIView.as_view(), name='player-list-create'),
     path('players/<int:id>/', views.PlayerRUDAPIView.as_view(), name='player-rud'),
+    path('players/export/<str:export_format>/', views.PlayerExportAPIView.as_view(), name='player-export'),
 
     # teams
     path('teams/', views.TeamListCreateAPIView.as_view(), name='team-list-create'),
     path('teams/<int:id>/', views.TeamRUDAPIView.as_view(), name='team-rud'),
+    path('teams/leaderboard/', views.TeamLeaderboardAPIView.as_view(), name='team-leaderboard'),
+    path('teams/<int:id>/rank/', views.TeamRankAPIView.as_view(), name='team-rank'),
+    path('teams/<int:id>/roster/', views.TeamRosterAPIView.as_view(), name='team-roster'),
+    path('teams/export/<str:export_format>/', views.TeamExportAPIView.as_view(), name='team-export'),
 
     # market list
     path('marketlist/', views.MarketListListCreateAPIView.as_view(), name='marketlist-list-create'),
+    path('marketlist/bulk/', views.MarketListBulkCreateAPIView.as_view(), name='marketlist-bulk-create'),
+    path('marketlist/buy/', views.MarketListBuyAPIView.as_view(), name='marketlist-buy'),
+    path('marketlist/export/<str:export_format>/', views.MarketListExportAPIView.as_view(), name='marketlist-export'),
     path('marketlist/<int:id>/', views.MarketlistRUAPIView.as_view(), name='marketlist-ru'),
+
+    # response cache counters
+    path('cache/stats/', views.CacheStatsAPIView.as_view(), name='cache-stats'),
 ]
\ No newline at end of file
@@ -5,29 +5,62 @@ from .serializers import (
     TeamAdminUserSerializer,
     TeamNormalUserSerializer,
     MarketListPutPlayerSerializer,
+    MarketListBulkPutPlayerSerializer,
+    MarketListBuyPlayersSerializer,
     MarketListDetailSerializer,    
+    TeamLeaderboardSerializer,
 )
 
 from rest_framework.generics import (
     GenericAPIView,     
     RetrieveUpdateDestroyAPIView, 
+    get_object_or_404,
     ListCreateAPIView,
     RetrieveUpdateAPIView
 )
 
 from soccer_manager.models import Player, Team, MarketList
+from soccer_manager import cache as response_cache, leaderboard
 from accounts.models import Account
 from rest_framework.permissions import IsAuthenticated, IsAdminUser
+from rest_framework.response import Response
+from rest_framework import status
         
-from .permissions import IsPlayerOwner, IsTeamOwner
-from rest_framework.exceptions import PermissionDenied
+from .conditional import ConditionalGetMixin
+from .export import ExportMixin
+from .rows import RowListMixin
+from .sparse import SparseFieldsMixin
+from .permissions import IsPlayerOwner, IsTeamOwner, get_team_id
+from rest_framework.exceptions import NotFound, PermissionDenied
 from.filters import MarketListFilter
 from django_filters import rest_framework as filters
 
-class PlayerListCreateAPIView(ListCreateAPIView):
+def player_serializer_class(user):
+    if user.is_admin:
+        return PlayerAdminUserSerializer
+    else:
+        return PlayerNormalUserSerializer
+
+def team_serializer_class(user):
+    if user.is_admin:
+        return TeamAdminUserSerializer
+    else:
+        return TeamNormalUserSerializer
+
+# ?expand= of the player and team views, see SparseFieldsMixin
+PLAYER_EXPANSIONS   = {'team': ('team', team_serializer_class, (response_cache.TEAMS,))}
+TEAM_EXPANSIONS     = {'players': ('player_set', player_serializer_class, (response_cache.PLAYERS,))}
+
+class PlayerListCreateAPIView(ConditionalGetMixin, SparseFieldsMixin, RowListMixin, ListCreateAPIView):
     serializer_class = PlayerAdminUserSerializer
     queryset = Player.objects.all()
     permission_classes = [IsAuthenticated,]
+    keyset_ordering_fields = {'market_value': 'market_value'}
+    validator_keys = [(response_cache.PLAYERS,)]
+    expandable_fields = PLAYER_EXPANSIONS
+
+    def get_validator_keys(self):
+        return super().get_validator_keys() + self.GetExpansionKeys()
 
     def perform_create(self, serializer):
          
@@ -45,16 +78,17 @@ class PlayerListCreateAPIView(ListCreateAPIView):
         else:    
             return self.queryset.filter(team__owner_id = self.request.user.id)
 
-class PlayerRUDAPIView(RetrieveUpdateDestroyAPIView):    
+class PlayerRUDAPIView(ConditionalGetMixin, SparseFieldsMixin, RetrieveUpdateDestroyAPIView):    
     queryset = Player.objects.all()
     permission_classes = [IsAuthenticated, IsPlayerOwner]
     lookup_field = 'id'
+    expandable_fields = PLAYER_EXPANSIONS
+
+    def get_validator_keys(self):
+        return [(response_cache.PLAYER, self.kwargs['id'])] + self.GetExpansionKeys()
     
     def get_serializer_class(self):
-        if self.request.user.is_admin:
-            return PlayerAdminUserSerializer
-        else:
-            return PlayerNormalUserSerializer
+        return player_serializer_class(self.request.user)
 
     def perform_destroy(self, serializer):
         if not self.request.user.is_admin:
@@ -62,10 +96,23 @@ class PlayerRUDAPIView(RetrieveUpdateDestroyAPIView):
         else:
             serializer.delete()
 
-class TeamListCreateAPIView(ListCreateAPIView):
+class TeamListCreateAPIView(ConditionalGetMixin, SparseFieldsMixin, RowListMixin, ListCreateAPIView):
     serializer_class = TeamAdminUserSerializer
-    queryset = Team.objects.all()
+    queryset = Team.objects.filter(owner__isnull=False) # pool teams aren't in the game yet
     permission_classes = [IsAuthenticated,]
+    keyset_ordering_fields = {'value': 'value', 'budget': 'budget'}
+    validator_keys = [(response_cache.TEAMS,)]
+    expandable_fields = TEAM_EXPANSIONS
+
+    def get_validator_keys(self):
+        return super().get_validator_keys() + self.GetExpansionKeys()
+
+    def GetExpandableFields(self):
+
+        # users see every team but only their own players
+        if self.request.user.is_admin:
+            return self.expandable_fields
+        return {name: expansion for name, expansion in self.expandable_fields.items() if name != 'players'}
     
     def perform_create(self, serializer):
          
@@ -74,16 +121,34 @@ class TeamListCreateAPIView(ListCreateAPIView):
 
         return serializer.save()
 
-class TeamRUDAPIView(RetrieveUpdateDestroyAPIView):    
+class TeamRUDAPIView(ConditionalGetMixin, SparseFieldsMixin, RetrieveUpdateDestroyAPIView):    
     queryset = Team.objects.all()
     permission_classes = [IsAuthenticated, IsTeamOwner]
     lookup_field = 'id'
+    expandable_fields = TEAM_EXPANSIONS
+
+    def get_validator_keys(self):
+        return [(response_cache.TEAM,), (response_cache.TEAM, self.kwargs['id'])] + self.GetExpansionKeys()
     
     def get_serializer_class(self):
-        if self.request.user.is_admin:
-            return TeamAdminUserSerializer
-        else:
-            return TeamNormalUserSerializer
+        return team_serializer_class(self.request.user)
+
+    def retrieve(self, request, *args, **kwargs):
+
+        team_id = self.kwargs['id']
+        self.GetValidators(request)
+
+        # the permissions are only checked against the owner kept with the response,
+        # after it's built or read from the cache, so both paths fail the same way
+        def build():
+            team = get_object_or_404(self.filter_queryset(self.get_queryset()), id = team_id)
+            return Response(self.get_serializer(team).data), team.owner_id
+
+        response, owner_id = response_cache.cached_response(
+            request, response_cache.TEAM, self.get_validator_keys(), build)
+        self.check_object_permissions(request, Team(id = team_id, owner_id = owner_id))
+
+        return self.NotModified(request) or response
 
     def perform_destroy(self, serializer):
         if not self.request.user.is_admin:
@@ -91,10 +156,77 @@ class TeamRUDAPIView(RetrieveUpdateDestroyAPIView):
         else:
             serializer.delete()
 
-class MarketListListCreateAPIView(ListCreateAPIView):
+class TeamRosterAPIView(ConditionalGetMixin, GenericAPIView):
+    queryset = Team.objects.all()
+    permission_classes = [IsAuthenticated, IsTeamOwner]
+    lookup_field = 'id'
+
+    def get_validator_keys(self):
+        team_id = self.kwargs['id']
+        return [(response_cache.TEAM,), (response_cache.TEAM, team_id), (response_cache.ROSTER,), (response_cache.ROSTER, team_id)]
+
+    def get(self, request, id):
+
+        self.GetValidators(request)
+
+        def build():
+            summary = Team.RosterSummary(id)
+            if summary is None:
+                raise NotFound(f'Team id {id} not found!')
+            return Response(summary), summary['owner']
+
+        # like the team detail, permissions are checked once against the owner kept with the response
+        response, owner_id = response_cache.cached_response(request, response_cache.ROSTER, self.get_validator_keys(), build)
+        self.check_object_permissions(request, Team(id = id, owner_id = owner_id))
+
+        return self.NotModified(request) or response
+
+class TeamLeaderboardAPIView(GenericAPIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+
+        serializer = TeamLeaderboardSerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        field, limit, offset = (serializer.validated_data[name] for name in ('by', 'limit', 'offset'))
+
+        # ranks and scores from the in-memory board, names with one query for the page
+        top, count  = leaderboard.board.Top(field, limit, offset)
+        names       = dict(Team.objects.filter(id__in = [team_id for team_id, _ in top]).values_list('id', 'name'))
+
+        return Response({
+            'by': field,
+            'count': count,
+            'results': [
+                {'rank': offset + index + 1, 'id': team_id, 'name': names.get(team_id), field: score}
+                for index, (team_id, score) in enumerate(top)
+            ],
+        })
+
+class TeamRankAPIView(GenericAPIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, id):
+
+        ranks, count = leaderboard.board.Ranks(id)
+        if ranks is None:
+            raise NotFound(f'Team id {id} is not ranked!')
+
+        return Response({
+            'team': id,
+            'count': count,
+            **{field: {'rank': rank, 'score': score} for field, (rank, score) in ranks.items()},
+        })
+
+class MarketListListCreateAPIView(ConditionalGetMixin, RowListMixin, ListCreateAPIView):
     
+    # read by RowListMixin, one joined values query per page with only the player
+    # columns MarketListDetailSerializer emits
     queryset = MarketList.objects.all()
     permission_classes = [IsAuthenticated]
+    keyset_ordering_fields = {'asked_price': 'asked_price', 'market_value': 'market_value', 'listed_at': 'listed_at'}
+    keyset_ordered_params = ('search',)
+    validator_keys = [(response_cache.MARKETLIST,)]
 
     filter_backends = (filters.DjangoFilterBackend,)
     filterset_class = MarketListFilter
@@ -104,17 +236,26 @@ class MarketListListCreateAPIView(ListCreateAPIView):
         serializer.is_valid(raise_exception = True)
         
         player_id = serializer.validated_data['player_id']
-        player = Player.objects.get(id = player_id)
-        request_user_team = Team.objects.get(owner=self.request.user)
+        player = Player.objects.select_related('team').get(id = player_id) # the team name goes in the listed event
         
         # player not from user team and not admin
-        if player.team != request_user_team and not self.request.user.is_admin:
+        if player.team.owner_id != self.request.user.id and not self.request.user.is_admin:
             raise PermissionDenied("You can't put players you don't own on the marketlist!")
         
-        player.asked_price = serializer.validated_data['asked_price']
-        player.save()
-        
-        MarketList.objects.get_or_create(player=player)
+        MarketList.ListPlayer(player, serializer.validated_data['asked_price'])
+
+    def list(self, request, *args, **kwargs):
+
+        not_modified = self.NotModified(request)
+        if not_modified:
+            return not_modified
+
+        # same pages for every user, cached until a listing, player or team changes
+        response, _ = response_cache.cached_response(
+            request, response_cache.MARKETLIST, [(response_cache.MARKETLIST,)],
+            lambda: (super(MarketListListCreateAPIView, self).list(request, *args, **kwargs), None))
+
+        return response
 
     def get_serializer_class(self):
 
@@ -123,6 +264,81 @@ class MarketListListCreateAPIView(ListCreateAPIView):
         else:
             return MarketListDetailSerializer
 
+class MarketListBulkCreateAPIView(GenericAPIView):
+    serializer_class = MarketListBulkPutPlayerSerializer
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        items = serializer.validated_data['players']
+
+        # ownership of every player checked with one query, the valid ones are listed
+        # together and the others reported item by item
+        players = Player.objects.select_related('team').in_bulk([item['player_id'] for item in items])
+
+        results, to_list = [], {}
+        for item in items:
+
+            player_id = item['player_id']
+            player = players.get(player_id)
+            if player is None:
+                error = f'Player id {player_id} not found!'
+            elif player.team.owner_id != request.user.id and not request.user.is_admin:
+                error = "You can't put players you don't own on the marketlist!"
+            elif player_id in to_list:
+                error = f'Player id {player_id} is repeated!'
+            else:
+                error = None
+                player.asked_price = item['asked_price']
+                to_list[player_id] = player
+
+            results.append({'player_id': player_id, 'asked_price': item['asked_price'], 'error': error})
+
+        MarketList.ListPlayers(list(to_list.values()))
+
+        # 207 when some of the players were not listed
+        failed = any(result['error'] for result in results)
+        return Response({'results': results}, status=status.HTTP_207_MULTI_STATUS if failed else status.HTTP_201_CREATED)
+
+class MarketListBuyAPIView(GenericAPIView):
+    serializer_class = MarketListBuyPlayersSerializer
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        buyer_team = serializer.validated_data.get('team')
+        if buyer_team is None:
+            user_team_id = get_team_id(request)
+            if user_team_id is None:
+                raise Exception(f"User id {request.user.id} doesn't have a team.")
+
+            # BuyPlayers() works on the instance, and the response shows it
+            buyer_team = Team.objects.get(id = user_team_id)
+
+        # user can't buy players to a team he doesn't own, unless he's admin
+        elif not request.user.is_admin and buyer_team.id != get_team_id(request):
+            raise Exception(f"You can't buy a player to a team you don't own.")
+
+        # every player is bought or none
+        player_ids = serializer.validated_data['players']
+        players = Player.objects.in_bulk(player_ids)
+        for player_id in player_ids:
+            if player_id not in players:
+                raise Exception(f"Player id {player_id} is not on the market list!")
+
+        players = [players[player_id] for player_id in player_ids]
+        buyer_team.BuyPlayers(players)
+
+        return Response({
+            'team': TeamNormalUserSerializer(buyer_team).data,
+            'players': PlayerMarketListUserSerializer(players, many=True).data,
+        })
+
 class MarketlistRUAPIView(RetrieveUpdateAPIView):        
     permission_classes = [IsAuthenticated]
     lookup_field = 'id'    
@@ -130,10 +346,11 @@ class MarketlistRUAPIView(RetrieveUpdateAPIView):
     def get_queryset(self):        
         
         player_id = self.kwargs['id']
-        if not MarketList.objects.filter(player__id = player_id):
+        if not MarketList.objects.filter(player_id = player_id).exists():
             raise Exception(f'Player id: {player_id} not on market list!')
 
-        return Player.objects.all()    
+        # the seller team is loaded with the player, Buy() updates it
+        return Player.objects.select_related('team')
     
     def get_serializer_class(self):
         return PlayerMarketListUserSerializer
@@ -143,23 +360,48 @@ class MarketlistRUAPIView(RetrieveUpdateAPIView):
         serializer.is_valid(raise_exception=True)
 
         # check if the request user has a team
-        try:
-            user_team = Team.objects.get(owner = self.request.user)
-        except:
+        user_team_id = get_team_id(self.request)
+        if user_team_id is None:
             raise Exception(f"User id {self.request.user.id} doesn't have a team.")
         
         buyer_team = serializer.validated_data['team']
 
         # user can't buy a player to a team he doens't own, unless he's admin
-        if user_team != buyer_team and self.request.user.is_admin == False:
+        if user_team_id != buyer_team.id and self.request.user.is_admin == False:
             raise Exception(f"You can't buy a player to a team you don't own.")
 
         # check if user is trying to buy his own player
-        player_id = self.kwargs['id']
-        player = Player.objects.get(id = player_id)
-        if player.team == buyer_team:
+        player = serializer.instance
+        if player.team_id == buyer_team.id:
             raise Exception(f"You can't buy your own player!")               
 
         buyer_team.Buy(player.team, player)
 
-        return PlayerMarketListUserSerializer(player)
\ No newline at end of file
+        return PlayerMarketListUserSerializer(player)
+
+class PlayerExportAPIView(ExportMixin, GenericAPIView):
+    serializer_class = PlayerAdminUserSerializer
+    queryset = Player.objects.all()
+    permission_classes = [IsAuthenticated, IsAdminUser]
+    export_name = 'players'
+
+class TeamExportAPIView(ExportMixin, GenericAPIView):
+    serializer_class = TeamAdminUserSerializer
+    queryset = Team.objects.filter(owner__isnull=False)
+    permission_classes = [IsAuthenticated, IsAdminUser]
+    export_name = 'teams'
+
+class MarketListExportAPIView(ExportMixin, GenericAPIView):
+    serializer_class = MarketListDetailSerializer
+    queryset = MarketList.objects.all()
+    permission_classes = [IsAuthenticated, IsAdminUser]
+    export_name = 'marketlist'
+
+    filter_backends = (filters.DjangoFilterBackend,)
+    filterset_class = MarketListFilter
+
+class CacheStatsAPIView(GenericAPIView):
+    permission_classes = [IsAuthenticated, IsAdminUser]
+
+    def get(self, request):
+        return Response(response_cache.get_stats(response_cache.MARKETLIST, response_cache.TEAM, response_cache.ROSTER))
@@ -0,0 +1,135 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from rest_framework.response import Response
+
+# read responses are cached under keys made of the request and the version counters
+# of the entities they were built from. writes bump the counters instead of deleting
+# keys, so every response depending on a changed entity misses from then on and the
+# old entries just expire.
+#
+# a cached response is fresh for RESPONSE_CACHE_TIMEOUT seconds and can be served
+# stale for RESPONSE_CACHE_STALE more, while the one request holding the rebuild lock
+# reads the database again. a bump is seen right away by the processes sharing the
+# cache.
+#
+# versions (and the ETag and Last-Modified validators built from them) expire after
+# RESPONSE_CACHE_TIMEOUT too. with a cache of the process (LocMemCache, the default)
+# the others don't see the bumps, their versions start again from the clock once
+# expired, so their responses and validators lag by RESPONSE_CACHE_TIMEOUT at most
+
+MARKETLIST  = 'marketlist'
+TEAM        = 'team'     # one team, or all of them when bumped without id
+TEAMS       = 'teams'    # any team, for the team list
+PLAYER      = 'player'
+PLAYERS     = 'players'  # any player, for the player list
+ROSTER      = 'roster'   # the players and listings of one team, or of all of them when bumped without id
+
+def _cache():
+    return caches[settings.RESPONSE_CACHE]
+
+def _VersionKey(entity, entity_id=None):
+    return f'version:{entity}' if entity_id is None else f'version:{entity}:{entity_id}'
+
+def _NewVersion():
+
+    # versions start from the clock, a counter lost with its cache entry never
+    # comes back with a value already used by the responses still cached
+    return time.time_ns() // 1000
+
+def get_validators(*keys):
+
+    # the versions of the keys and the last time any of them was bumped. a version
+    # missing from the cache starts now, it can only make clients download again
+    cache           = _cache()
+    version_keys    = [_VersionKey(*key) for key in keys]
+    values          = cache.get_many(version_keys + ['modified:' + key for key in version_keys])
+
+    for key in version_keys:
+        if key not in values:
+            version = _NewVersion()
+            if cache.add(key, version, settings.RESPONSE_CACHE_TIMEOUT):
+                values['modified:' + key] = time.time()
+                cache.set('modified:' + key, values['modified:' + key], settings.RESPONSE_CACHE_TIMEOUT)
+            else:
+                version = cache.get(key, version)
+            values[key] = version
+
+    modified = max(values.get('modified:' + key) or time.time() for key in version_keys)
+    return [values[key] for key in version_keys], modified
+
+def get_versions(*keys):
+    return get_validators(*keys)[0]
+
+def _Bump(version_keys):
+
+    cache = _cache()
+    for key in version_keys:
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.add(key, _NewVersion(), settings.RESPONSE_CACHE_TIMEOUT)
+
+    now = time.time()
+    cache.set_many({'modified:' + key: now for key in version_keys}, settings.RESPONSE_CACHE_TIMEOUT)
+
+def bump(*keys):
+
+    # bumped now, so reads later in this transaction miss, and again once it commits,
+    # dropping what other requests cached from the old rows in between
+    version_keys = [_VersionKey(*key) for key in keys]
+    _Bump(version_keys)
+    transaction.on_commit(lambda: _Bump(version_keys))
+
+def _Count(name, outcome):
+
+    cache = _cache()
+    key = f'stats:{name}:{outcome}'
+    try:
+        cache.incr(key)
+    except ValueError:
+        if not cache.add(key, 1, None):
+            cache.incr(key)
+
+def get_stats(*names):
+
+    cache = _cache()
+    outcomes = ['hit', 'stale', 'miss']
+    counters = cache.get_many([f'stats:{name}:{outcome}' for name in names for outcome in outcomes])
+
+    return {name: {outcome: counters.get(f'stats:{name}:{outcome}', 0) for outcome in outcomes} for name in names}
+
+def cached_response(request, name, version_keys, build):
+
+    # build() returns a (response, context) pair. context is kept next to the cached
+    # data, for checks the view has to make before serving it (object permissions)
+    cache       = _cache()
+    versions    = get_versions(*version_keys)
+    path        = request.build_absolute_uri()
+    key         = 'response:' + hashlib.md5(f'{name}|{versions}|{path}'.encode()).hexdigest()
+    now         = time.time()
+
+    entry = cache.get(key)
+    if entry is not None:
+        data, status, context, fresh_until = entry
+        if now < fresh_until:
+            _Count(name, 'hit')
+            return Response(data, status=status, headers={'X-Cache': 'HIT'}), context
+
+        # stale, only the request taking the lock goes to the database
+        if not cache.add(key + ':lock', 1, settings.RESPONSE_CACHE_STALE):
+            _Count(name, 'stale')
+            return Response(data, status=status, headers={'X-Cache': 'STALE'}), context
+
+    _Count(name, 'miss')
+    response, context = build()
+    if response.status_code == 200:
+        cache.set(key, (response.data, response.status_code, context, now + settings.RESPONSE_CACHE_TIMEOUT),
+                  settings.RESPONSE_CACHE_TIMEOUT + settings.RESPONSE_CACHE_STALE)
+        cache.delete(key + ':lock')
+
+    response['X-Cache'] = 'MISS'
+    return response, context
@@ -0,0 +1,258 @@
+import json
+import psycopg2
+import select
+import threading
+import time
+
+from collections import deque
+
+from django.conf import settings
+from django.db import connection, transaction
+
+# market list events for the streaming endpoint (see soccer_manager/api/events.py).
+#
+# events are published by the request threads once their transaction commits and
+# fanned out by the event loop of the asgi server, one callback per loop whatever
+# the number of subscribers. the last MARKET_EVENTS_BUFFER events are kept so a
+# client reconnecting with its last event id gets what it missed.
+#
+# on postgresql events go through NOTIFY on CHANNEL, numbered by SEQUENCE, and every
+# asgi process feeds its broker from a LISTEN thread (see listen()). all processes
+# see the same events with the same ids, a client can resume on any of them. other
+# databases keep a broker of the process, events of other processes are not seen
+
+CHANNEL     = 'soccer_manager_market_events'
+SEQUENCE    = 'soccer_manager_market_event_id' # created by migration 0011
+LOCK        = 7260013 # advisory lock key, ids are taken in commit order
+
+LISTED          = 'listed'
+PRICE_CHANGED   = 'price changed'
+SOLD            = 'sold'
+
+
+class Subscription():
+
+    __slots__ = ('loop', 'queue', 'limit', 'last_id', 'closed')
+
+    def __init__(self, loop, queue, limit, last_id):
+
+        self.loop       = loop
+        self.queue      = queue
+        self.limit      = limit
+        self.last_id    = last_id
+        self.closed     = False
+
+    def Deliver(self, event):
+
+        # an event can be both in the backlog and dispatched, ids drop the second copy
+        if event['id'] <= self.last_id or self.closed:
+            return
+
+        if self.queue.qsize() >= self.limit:
+            # too slow, the stream is closed and the client resumes from its last id
+            self.Close()
+            return
+
+        self.last_id = event['id']
+        self.queue.put_nowait(event)
+
+    def Close(self):
+
+        if not self.closed:
+            self.closed = True
+            self.queue.put_nowait(None)
+
+
+class Broker():
+
+    def __init__(self, size):
+
+        self.lock       = threading.Lock()
+        self.events     = deque(maxlen=size)
+        self.loops      = {}
+
+        # ids keep growing across restarts, an old id is never mistaken for a new event.
+        # with the database channel the ids are the SEQUENCE ones, set by Reset()
+        self.last_id    = time.time_ns() // 1000
+
+    def Publish(self, event_type, data):
+
+        # an event of this process, numbered here
+        with self.lock:
+            self.last_id += 1
+            event = {'id': self.last_id, 'event': event_type, 'data': data}
+            self.events.append(event)
+            loops = list(self.loops)
+
+        self._Send(loops, self._Dispatch, event)
+        return event
+
+    def Deliver(self, event):
+
+        # an event of the database channel, already numbered. ids up to the one of the
+        # last Reset() were sent before it, they are dropped
+        with self.lock:
+            if event['id'] <= self.last_id:
+                return
+            self.last_id = event['id']
+            self.events.append(event)
+            loops = list(self.loops)
+
+        self._Send(loops, self._Dispatch, event)
+
+    def Reset(self, last_id):
+
+        # the buffer no longer follows the ids (listener (re)connected), it's emptied and
+        # the streams closed. their clients resume from an id the buffer doesn't have
+        # and get a reset
+        with self.lock:
+            self.events.clear()
+            self.last_id    = last_id
+            loops           = self.loops
+            self.loops      = {}
+
+        for loop, subscriptions in loops.items():
+            self._Send([loop], self._Close, subscriptions)
+
+    def _Send(self, loops, callback, argument):
+
+        for loop in loops:
+            try:
+                loop.call_soon_threadsafe(callback, loop, argument)
+            except RuntimeError:
+                # loop closed
+                with self.lock:
+                    self.loops.pop(loop, None)
+
+    def _Dispatch(self, loop, event):
+
+        for subscription in list(self.loops.get(loop, ())):
+            subscription.Deliver(event)
+
+    def _Close(self, loop, subscriptions):
+
+        for subscription in subscriptions:
+            subscription.Close()
+
+    def Subscribe(self, loop, queue, limit, last_id=None):
+
+        # returns the subscription, the buffered events after last_id and whether
+        # some events after last_id were already dropped from the buffer
+        with self.lock:
+            if last_id is None:
+                last_id = self.last_id
+
+            # an id ahead of the broker wasn't issued by it (another process before the
+            # database channel, or a restart), the client can't tell what it missed
+            backlog = [event for event in self.events if event['id'] > last_id]
+            missed  = last_id != self.last_id and (not backlog or backlog[0]['id'] > last_id + 1)
+
+            subscription = Subscription(loop, queue, limit, self.last_id)
+            self.loops.setdefault(loop, set()).add(subscription)
+
+        return subscription, backlog, missed
+
+    def Unsubscribe(self, subscription):
+
+        with self.lock:
+            subscriptions = self.loops.get(subscription.loop)
+            if subscriptions is not None:
+                subscriptions.discard(subscription)
+                if not subscriptions:
+                    del self.loops[subscription.loop]
+
+
+broker = Broker(settings.MARKET_EVENTS_BUFFER)
+
+
+def listing_data(player, team_name, **extra):
+
+    # the fields MarketListFilter works on, so subscribers can filter the stream
+    data = {
+        'player_id': player.id,
+        'first_name': player.first_name,
+        'last_name': player.last_name,
+        'team_id': player.team_id,
+        'team_name': team_name,
+        'asked_price': player.asked_price,
+        'market_value': player.market_value,
+        'position': player.position,
+        'age': player.age,
+        'country': str(player.country),
+    }
+    data.update(extra)
+    return data
+
+def publish(event_type, data):
+
+    # nothing is announced for a transaction that rolls back
+    if connection.vendor == 'postgresql':
+        transaction.on_commit(lambda: _Notify(event_type, data))
+    else:
+        transaction.on_commit(lambda: broker.Publish(event_type, data))
+
+def _Notify(event_type, data):
+
+    # the lock is held until commit, so ids reach the listeners in order
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute('SELECT pg_advisory_xact_lock(%s)', [LOCK])
+        cursor.execute(
+            "SELECT pg_notify(%s, json_build_object('id', nextval(%s), 'event', %s, 'data', %s::json)::text)",
+            [CHANNEL, SEQUENCE, event_type, json.dumps(data)]
+        )
+
+
+_listener       = None
+_listener_lock  = threading.Lock()
+
+def listen():
+
+    # starts the thread feeding the broker from the database channel, once per process.
+    # called by the streaming endpoint before it subscribes
+    global _listener
+
+    if connection.vendor != 'postgresql':
+        return
+
+    with _listener_lock:
+        if _listener is None:
+            _listener = threading.Thread(
+                target=_Listen, args=(connection.get_connection_params(),), name='market-events', daemon=True)
+            _listener.start()
+
+def _Listen(params):
+
+    while True:
+        try:
+            _Follow(psycopg2.connect(**params))
+        except psycopg2.Error:
+            # events sent while disconnected are lost, the next Reset() tells the clients
+            pass
+
+        time.sleep(1)
+
+def _Follow(db):
+
+    db.autocommit = True
+    try:
+        with db.cursor() as cursor:
+            cursor.execute(f'LISTEN {CHANNEL}')
+
+            # with the lock no event is being sent, the ones up to the sequence value
+            # came before LISTEN and the next ones will be received
+            cursor.execute('SELECT pg_advisory_lock(%s)', [LOCK])
+            cursor.execute(f'SELECT CASE WHEN is_called THEN last_value ELSE 0 END FROM {SEQUENCE}')
+            broker.Reset(cursor.fetchone()[0])
+            cursor.execute('SELECT pg_advisory_unlock(%s)', [LOCK])
+
+            while True:
+                if not select.select([db], [], [], settings.MARKET_EVENTS_KEEPALIVE)[0]:
+                    # nothing for a while, checks the connection is still up
+                    cursor.execute('SELECT 1')
+                    continue
+
+                db.poll()
+                while db.notifies:
+                    broker.Deliver(json.loads(db.notifies.pop(0).payload))
+    finally:
+        db.close()
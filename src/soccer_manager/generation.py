@@ -0,0 +1,106 @@
+import bisect
+import itertools
+import os
+import random
+import threading
+
+from array import array
+from functools import lru_cache
+
+import names
+from django_countries.data import COUNTRIES
+
+# random data for new teams and players. the census name files shipped with the
+# names package are read once per process into compact arrays and sampled with a
+# per-thread generator, instead of scanning the files on every call
+
+COUNTRY_CODES = tuple(COUNTRIES)
+
+MIN_PLAYER_AGE = 18
+MAX_PLAYER_AGE = 40
+
+
+class NameDistribution():
+
+    __slots__ = ('names', 'cumulative', 'total')
+
+    def __init__(self, filename):
+
+        self.names      = []
+        self.cumulative = array('d')
+
+        with open(filename) as name_file:
+            for line in name_file:
+                name, _, cumulative, _ = line.split()
+                self.names.append(name.capitalize())
+                self.cumulative.append(float(cumulative))
+
+        self.total = self.cumulative[-1] if self.cumulative else 0
+
+    def sample(self, generator):
+
+        if not self.names:
+            return ""
+
+        return self.names[bisect.bisect_right(self.cumulative, generator.random() * self.total)]
+
+
+@lru_cache(maxsize=None)
+def _distribution(name):
+    return NameDistribution(names.FILES[name])
+
+
+_local      = threading.local()
+_seed       = None
+_worker     = None
+_streams    = itertools.count(1)
+
+def seed(value=None):
+
+    # seed the generators of this process, used to get reproducible data
+    global _seed, _streams
+
+    _seed       = value
+    _streams    = itertools.count(1)
+    _local.generator = random.Random(value)
+
+def rng():
+
+    # with a seed, every other thread and forked worker gets its own stream derived
+    # from it instead of replaying the sequence of the seeding thread
+    generator = getattr(_local, 'generator', None)
+    if generator is None:
+        generator = _local.generator = random.Random(None if _seed is None else f'{_seed}/{_worker}/{next(_streams)}')
+
+    return generator
+
+def _after_fork():
+
+    global _worker, _streams
+
+    _worker     = os.getpid()
+    _streams    = itertools.count(1)
+    _local.__dict__.pop('generator', None)
+
+# a forked worker must not replay the random sequence of its parent
+os.register_at_fork(after_in_child=_after_fork)
+
+
+def first_name():
+    return _distribution('first:male').sample(rng())
+
+def last_name():
+    return _distribution('last').sample(rng())
+
+def country():
+    return rng().choice(COUNTRY_CODES)
+
+def player(position):
+
+    return {
+        'first_name': first_name(),
+        'last_name': last_name(),
+        'age': rng().randint(MIN_PLAYER_AGE, MAX_PLAYER_AGE),
+        'country': country(),
+        'position': position,
+    }
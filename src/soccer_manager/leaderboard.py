@@ -0,0 +1,176 @@
+import threading
+import time
+
+from bisect import bisect_left, insort
+
+from django.apps import apps
+from django.conf import settings
+from django.db import transaction
+
+# rankings of the teams in the game (owned teams) by value and by budget, kept in
+# memory and sorted. a rank or a page of the top is a binary search and a slice
+# instead of ORDER BY value OFFSET n over the whole table.
+#
+# the board is loaded from the database on first use. writes to teams call touch()
+# with the changed ids, their rows are read again once the transaction commits and
+# moved in the rankings. the board lives in the process like the event broker,
+# changes made by other processes are picked up by a full reload every
+# LEADERBOARD_RELOAD seconds
+
+FIELDS = ('value', 'budget')
+
+
+class Ranking():
+
+    # (-score, team id) pairs in ascending order, the highest score first and the
+    # lowest id first on ties
+    __slots__ = ('keys', 'scores')
+
+    def __init__(self):
+
+        self.keys   = []
+        self.scores = {}
+
+    def Set(self, team_id, score):
+
+        self.Remove(team_id)
+        self.scores[team_id] = score
+        insort(self.keys, (-score, team_id))
+
+    def Remove(self, team_id):
+
+        score = self.scores.pop(team_id, None)
+        if score is not None:
+            del self.keys[bisect_left(self.keys, (-score, team_id))]
+
+    def Rank(self, team_id):
+
+        # 1 for the first team, None if the team isn't ranked
+        score = self.scores.get(team_id)
+        if score is None:
+            return None
+
+        return bisect_left(self.keys, (-score, team_id)) + 1
+
+    def Top(self, count, offset=0):
+        return [(team_id, -score) for score, team_id in self.keys[offset:offset + count]]
+
+
+class Leaderboard():
+
+    # the database is never read with the lock held. a reload builds new rankings
+    # while readers keep using the current ones and swaps them in, a refresh reads
+    # its rows first and only moves them in the rankings under the lock
+
+    def __init__(self):
+
+        self.lock       = threading.Lock()
+        self.loading    = threading.Lock()
+        self.rankings   = None
+        self.loaded_at  = 0
+        self.touched    = None # teams refreshed while a reload reads the table
+
+    def _Rows(self, **filters):
+
+        # the models import this module
+        Team = apps.get_model('soccer_manager', 'Team')
+        return Team.objects.filter(**filters).values_list('id', 'owner_id', *FIELDS)
+
+    def _Expired(self):
+        return self.rankings is None or time.monotonic() - self.loaded_at > settings.LEADERBOARD_RELOAD
+
+    def _Load(self):
+
+        # one reload at a time, only the first load makes readers wait for it
+        if not self.loading.acquire(blocking = self.rankings is None):
+            return
+
+        try:
+            with self.lock:
+                if not self._Expired():
+                    return
+                self.touched = set()
+
+            rankings = {field: Ranking() for field in FIELDS}
+            for team_id, owner_id, *scores in self._Rows(owner__isnull = False).iterator():
+                for field, score in zip(FIELDS, scores):
+                    rankings[field].scores[team_id] = score
+
+            # sorted once instead of inserted one by one
+            for ranking in rankings.values():
+                ranking.keys = sorted((-score, team_id) for team_id, score in ranking.scores.items())
+
+            with self.lock:
+                self.rankings   = rankings
+                self.loaded_at  = time.monotonic()
+                touched         = self.touched
+                self.touched    = None
+        finally:
+            self.loading.release()
+
+        # the table may have been read before these changes committed
+        if touched:
+            self.Refresh(touched)
+
+    def _Rankings(self):
+
+        if self._Expired():
+            self._Load()
+
+        return self.rankings
+
+    def Refresh(self, team_ids):
+
+        if self.rankings is None and self.touched is None:
+            return
+
+        rows = {row[0]: row for row in self._Rows(id__in = team_ids)}
+        with self.lock:
+            if self.touched is not None:
+                self.touched.update(team_ids)
+            if self.rankings is None:
+                return
+
+            for team_id in team_ids:
+                row = rows.get(team_id)
+                for index, field in enumerate(FIELDS):
+                    # deleted or back in the pool
+                    if row is None or row[1] is None:
+                        self.rankings[field].Remove(team_id)
+                    else:
+                        self.rankings[field].Set(team_id, row[2 + index])
+
+    def Top(self, field, count, offset=0):
+
+        # [(team id, score)], and the number of ranked teams
+        rankings = self._Rankings()
+        with self.lock:
+            ranking = rankings[field]
+            return ranking.Top(count, offset), len(ranking.keys)
+
+    def Ranks(self, team_id):
+
+        # {field: (rank, score)} or None if the team isn't ranked, and the number of ranked teams
+        rankings = self._Rankings()
+        with self.lock:
+            count = len(rankings[FIELDS[0]].keys)
+            if team_id not in rankings[FIELDS[0]].scores:
+                return None, count
+
+            return {field: (ranking.Rank(team_id), ranking.scores[team_id]) for field, ranking in rankings.items()}, count
+
+    def Clear(self):
+
+        with self.lock:
+            self.rankings = None
+
+
+board = Leaderboard()
+
+
+def touch(*team_ids):
+
+    # a rolled back change never reaches the board
+    team_ids = [team_id for team_id in team_ids if team_id]
+    if team_ids:
+        transaction.on_commit(lambda: board.Refresh(team_ids))
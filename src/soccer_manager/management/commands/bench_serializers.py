@@ -0,0 +1,50 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from soccer_manager.api.rows import row_serializer
+from soccer_manager.api.serializers import MarketListDetailSerializer, PlayerAdminUserSerializer, TeamAdminUserSerializer
+from soccer_manager.models import Team, Player, MarketList
+
+LISTS = {
+    'players': (PlayerAdminUserSerializer, lambda: Player.objects.all()),
+    'teams': (TeamAdminUserSerializer, lambda: Team.objects.all()),
+    'marketlist': (MarketListDetailSerializer, lambda: MarketList.objects.select_related('player')),
+}
+
+
+class Command(BaseCommand):
+
+    help = 'Compare list page throughput of the DRF serializers and the compiled row serializers.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='10,100,500', help='Comma separated page sizes.')
+        parser.add_argument('--repeat', type=int, default=20, help='Pages read per measure.')
+
+    def handle(self, *args, **options):
+
+        sizes   = [int(size) for size in options['sizes'].split(',')]
+        repeat  = options['repeat']
+
+        self.stdout.write(f'{"list":<12}{"page":>6}{"rows":>7}{"drf rows/s":>14}{"compiled rows/s":>17}{"speedup":>10}')
+
+        for name, (serializer_class, queryset) in LISTS.items():
+
+            rows = row_serializer(serializer_class)
+            for size in sizes:
+
+                # the query is part of both measures, each reads the page the way its path does
+                slow, count = self._Measure(repeat, lambda: serializer_class(list(queryset()[:size]), many=True).data)
+                fast, _ = self._Measure(repeat, lambda: rows.Serialize(rows.Read(queryset())[:size]))
+
+                self.stdout.write(
+                    f'{name:<12}{size:>6}{count:>7}{count * repeat / slow:>14.0f}{count * repeat / fast:>17.0f}{slow / fast:>9.1f}x')
+
+    def _Measure(self, repeat, read):
+
+        count = len(read())
+        started = time.perf_counter()
+        for _ in range(repeat):
+            read()
+
+        return max(time.perf_counter() - started, 1e-9), count
@@ -0,0 +1,32 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from soccer_manager.models import Team, build_team
+
+
+class Command(BaseCommand):
+
+    help = 'Generate unowned teams until the pool claimed by new users has the configured size.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--size', type=int, default=settings.TEAM_POOL_SIZE, help='Number of free teams to keep in the pool.')
+        parser.add_argument('--loop', action='store_true', help='Keep running and refill the pool every interval.')
+        parser.add_argument('--interval', type=float, default=5, help='Seconds between refills when looping.')
+
+    def handle(self, *args, **options):
+
+        while True:
+
+            missing = options['size'] - Team.objects.filter(pooled = True).count()
+            for i in range(missing):
+                build_team('Unnamed', pooled = True)
+
+            if missing > 0:
+                self.stdout.write(f'{missing} teams added to the pool.')
+
+            if not options['loop']:
+                break
+
+            time.sleep(options['interval'])
@@ -0,0 +1,177 @@
+import multiprocessing
+import time
+
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+from io import StringIO
+
+import django
+from django.apps import apps
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand
+from django.db import connection, connections, transaction
+from django.db.models import Max
+
+from accounts.models import Account
+from soccer_manager import cache as response_cache, generation
+from soccer_manager.models import Team, Player, MarketList, TEAM_COMPOSITION
+
+SQUAD_SIZE = sum(TEAM_COMPOSITION.values())
+
+
+def _init_worker():
+
+    # spawned workers start without django, forked ones reconnect on first query
+    if not apps.ready:
+        django.setup()
+
+    connections.close_all()
+
+def _copy_value(value):
+
+    if value is None:
+        return '\\N'
+    if isinstance(value, bool):
+        return 't' if value else 'f'
+    if isinstance(value, datetime):
+        return value.isoformat()
+
+    return str(value).replace('\\', '\\\\').replace('\t', '\\t').replace('\n', '\\n').replace('\r', '\\r')
+
+def _write(model, objs, with_pk=True):
+
+    if connection.vendor != 'postgresql':
+        model.objects.bulk_create(objs)
+        return
+
+    # postgresql: stream the rows through COPY, values prepared by the model fields
+    fields = [field for field in model._meta.concrete_fields if with_pk or not field.primary_key]
+    buffer = StringIO()
+    for obj in objs:
+        buffer.write('\t'.join(_copy_value(field.get_db_prep_save(field.pre_save(obj, True), connection)) for field in fields))
+        buffer.write('\n')
+    buffer.seek(0)
+
+    table   = connection.ops.quote_name(model._meta.db_table)
+    columns = ', '.join(connection.ops.quote_name(field.column) for field in fields)
+    with connection.cursor() as cursor:
+        cursor.copy_expert(f'COPY {table} ({columns}) FROM STDIN', buffer)
+
+def _generate_batch(batch, first, count, first_ids, password, seed, listed_ratio):
+
+    generation.seed(None if seed is None else f'{seed}-{batch}')
+    rng = generation.rng()
+
+    accounts, teams, players, listings = [], [], [], []
+
+    for i in range(first, first + count):
+
+        account_id  = first_ids['account'] + i
+        team_id     = first_ids['team'] + i
+        player_id   = first_ids['player'] + i * SQUAD_SIZE
+
+        accounts.append(Account(
+            id = account_id,
+            password = password,
+            email = f'loadtest{account_id}@soccer.local',
+            first_name = generation.first_name(),
+            last_name = generation.last_name(),
+            is_verified = True,
+            ))
+
+        squad = []
+        for position, num_players in TEAM_COMPOSITION.items():
+            for j in range(num_players):
+                squad.append(Player(id = player_id, team_id = team_id, **generation.player(position)))
+                player_id += 1
+
+        for player in squad:
+            if rng.random() < listed_ratio:
+                player.asked_price = round(player.market_value * rng.uniform(1, 1.5))
+                listings.append(MarketList(player_id = player.id, **MarketList.PlayerFields(player)))
+
+        teams.append(Team(
+            id = team_id,
+            name = f"{accounts[-1].first_name}'s Team",
+            country = generation.country(),
+            value = sum(player.market_value for player in squad),
+            owner_id = account_id,
+            ))
+        players += squad
+
+    with transaction.atomic():
+        _write(Account, accounts)
+        _write(Team, teams)
+        _write(Player, players)
+        _write(MarketList, listings, with_pk=False)
+
+    return count, len(players), len(listings)
+
+def _reserve_ids(model, count):
+
+    first = (model.objects.aggregate(last = Max('id'))['last'] or 0) + 1
+
+    # move the sequence past the generated ids so the app keeps inserting after them
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT setval(pg_get_serial_sequence(%s, 'id'), %s)", [model._meta.db_table, first + count - 1])
+
+    return first
+
+
+class Command(BaseCommand):
+
+    help = 'Generate accounts, teams, players and market listings for load testing.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('teams', type=int, help='Number of accounts and teams to generate.')
+        parser.add_argument('--listed-ratio', type=float, default=0.05, help='Share of the players put on the market list.')
+        parser.add_argument('--seed', help='Seed for reproducible data.')
+        parser.add_argument('--batch-size', type=int, default=500, help='Teams generated and written per task.')
+        parser.add_argument('--workers', type=int, default=multiprocessing.cpu_count(), help='Worker processes (postgresql only).')
+        parser.add_argument('--password', default='loadtest', help='Password of every generated account.')
+
+    def handle(self, *args, **options):
+
+        total       = options['teams']
+        batch_size  = options['batch_size']
+        started     = time.time()
+
+        first_ids = {
+            'account': _reserve_ids(Account, total),
+            'team': _reserve_ids(Team, total),
+            'player': _reserve_ids(Player, total * SQUAD_SIZE),
+        }
+
+        # hashing is slow on purpose, every generated account shares the same hash
+        password = make_password(options['password'])
+
+        batches = [
+            (batch, first, min(batch_size, total - first), first_ids, password, options['seed'], options['listed_ratio'])
+            for batch, first in enumerate(range(0, total, batch_size))
+        ]
+
+        # sqlite allows a single writer, load it from this process with bulk_create
+        if connection.vendor != 'postgresql' or options['workers'] <= 1:
+            self._Report(total, started, (_generate_batch(*batch) for batch in batches))
+            generation.seed(None)
+        else:
+            connections.close_all()
+            context = multiprocessing.get_context('fork' if 'fork' in multiprocessing.get_all_start_methods() else 'spawn')
+            with ProcessPoolExecutor(max_workers=options['workers'], mp_context=context, initializer=_init_worker) as executor:
+                futures = [executor.submit(_generate_batch, *batch) for batch in batches]
+                self._Report(total, started, (future.result() for future in as_completed(futures)))
+
+        # the rows were written without signals
+        response_cache.bump((response_cache.MARKETLIST,), (response_cache.TEAMS,), (response_cache.PLAYERS,))
+
+    def _Report(self, total, started, results):
+
+        teams, players, listings = 0, 0, 0
+        for batch_teams, batch_players, batch_listings in results:
+            teams       += batch_teams
+            players     += batch_players
+            listings    += batch_listings
+            self.stdout.write(f'{teams}/{total} teams, {players} players, {listings} listings')
+
+        self.stdout.write(self.style.SUCCESS(f'{teams} teams, {players} players and {listings} listings generated in {time.time() - started:.1f}s.'))
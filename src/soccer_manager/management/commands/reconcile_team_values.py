@@ -0,0 +1,53 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Sum
+
+from soccer_manager.models import Team
+
+
+class Command(BaseCommand):
+
+    help = 'Recompute the value of every team from its players and fix the ones that drifted.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000, help='Number of teams checked per aggregate query.')
+        parser.add_argument('--tolerance', type=float, default=0.01, help='Drift ignored as float rounding noise.')
+        parser.add_argument('--dry-run', action='store_true', help='Only report the drifted teams.')
+
+    def handle(self, *args, **options):
+
+        chunk_size  = options['chunk_size']
+        tolerance   = options['tolerance']
+        last_id     = 0
+        checked     = 0
+        fixed       = 0
+
+        while True:
+
+            # one aggregate query per chunk. team value and players are read in the
+            # same statement, so value - total is the exact drift even under load
+            chunk = list(
+                Team.objects
+                .filter(id__gt = last_id)
+                .order_by('id')
+                .annotate(total = Sum('player__market_value'))
+                .values_list('id', 'value', 'total')[:chunk_size]
+            )
+            if not chunk:
+                break
+
+            last_id = chunk[-1][0]
+            checked += len(chunk)
+
+            drifted = [(team_id, (total or 0) - value) for team_id, value, total in chunk if abs((total or 0) - value) > tolerance]
+            if drifted and not options['dry_run']:
+                with transaction.atomic():
+                    for team_id, drift in drifted:
+                        Team.AddValue(team_id, drift)
+
+            for team_id, drift in drifted:
+                self.stdout.write(f'team id {team_id} drifted by {drift:.2f}')
+
+            fixed += len(drifted)
+
+        self.stdout.write(self.style.SUCCESS(f'{checked} teams checked, {fixed} drifted.'))
@@ -0,0 +1,25 @@
+# Generated by Django 3.1.4 on 2026-10-18 01:15
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('soccer_manager', '0004_auto_20210104_1643'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='marketlist',
+            options={'ordering': ['id']},
+        ),
+        migrations.AlterField(
+            model_name='team',
+            name='owner',
+            field=models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 3.1.4 on 2026-10-18 01:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('soccer_manager', '0005_auto_20261018_0115'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='player',
+            index=models.Index(fields=['market_value', 'id'], name='soccer_mana_market__6eabb8_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='team',
+            index=models.Index(fields=['value', 'id'], name='soccer_mana_value_414c3e_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='team',
+            index=models.Index(fields=['budget', 'id'], name='soccer_mana_budget_e6abca_idx'),
+        ),
+    ]
@@ -0,0 +1,56 @@
+# Generated by Django 3.1.4 on 2026-10-18 01:24
+
+from django.db import migrations, models
+
+# trigram indexes behind the market list name search. built on upper(column) because
+# that is how django compiles istartswith / icontains on postgresql. other databases
+# search without them
+
+TRIGRAM_INDEXES = [
+    ('soccer_manager_player_first_name_trgm', 'soccer_manager_player', 'first_name'),
+    ('soccer_manager_player_last_name_trgm', 'soccer_manager_player', 'last_name'),
+    ('soccer_manager_team_name_trgm', 'soccer_manager_team', 'name'),
+]
+
+def create_trigram_indexes(apps, schema_editor):
+    
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    for name, table, column in TRIGRAM_INDEXES:
+        schema_editor.execute(f'CREATE INDEX IF NOT EXISTS {name} ON {table} USING gin (UPPER({column}) gin_trgm_ops)')
+
+def drop_trigram_indexes(apps, schema_editor):
+
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+
+    for name, table, column in TRIGRAM_INDEXES:
+        schema_editor.execute(f'DROP INDEX IF EXISTS {name}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('soccer_manager', '0006_auto_20261018_0123'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='player',
+            name='first_name',
+            field=models.CharField(db_index=True, default='', max_length=100),
+        ),
+        migrations.AlterField(
+            model_name='player',
+            name='last_name',
+            field=models.CharField(db_index=True, default='', max_length=100),
+        ),
+        migrations.AlterField(
+            model_name='team',
+            name='name',
+            field=models.CharField(db_index=True, default='Unnamed', max_length=100),
+        ),
+        migrations.RunPython(create_trigram_indexes, drop_trigram_indexes),
+    ]
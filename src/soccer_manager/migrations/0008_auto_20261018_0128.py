@@ -0,0 +1,86 @@
+# Generated by Django 3.1.4 on 2026-10-18 01:28
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+import django.utils.timezone
+import django_countries.fields
+
+
+def copy_player_fields(apps, schema_editor):
+
+    MarketList = apps.get_model('soccer_manager', 'MarketList')
+    Player = apps.get_model('soccer_manager', 'Player')
+
+    player = Player.objects.filter(id=OuterRef('player_id'))
+    MarketList.objects.update(**{
+        field: Subquery(player.values(field)[:1])
+        for field in ['asked_price', 'market_value', 'position', 'age', 'country']
+    })
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('soccer_manager', '0007_auto_20261018_0124'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='marketlist',
+            name='age',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='marketlist',
+            name='asked_price',
+            field=models.FloatField(default=0),
+        ),
+        migrations.AddField(
+            model_name='marketlist',
+            name='country',
+            field=django_countries.fields.CountryField(default='', max_length=2),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='marketlist',
+            name='listed_at',
+            field=models.DateTimeField(auto_now_add=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='marketlist',
+            name='market_value',
+            field=models.FloatField(default=0),
+        ),
+        migrations.AddField(
+            model_name='marketlist',
+            name='position',
+            field=models.CharField(choices=[('GOALKEEPER', 'GOALKEEPER'), ('DEFENDER', 'DEFENDER'), ('MIDFIELDER', 'MIDFIELDER'), ('ATTACKER', 'ATTACKER')], default='', max_length=16),
+            preserve_default=False,
+        ),
+        migrations.RunPython(copy_player_fields, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='marketlist',
+            index=models.Index(fields=['asked_price', 'id'], name='soccer_mana_asked_p_d78339_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='marketlist',
+            index=models.Index(fields=['market_value', 'id'], name='soccer_mana_market__985f04_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='marketlist',
+            index=models.Index(fields=['country', 'market_value'], name='soccer_mana_country_06bb01_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='marketlist',
+            index=models.Index(fields=['position', 'asked_price'], name='soccer_mana_positio_531445_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='marketlist',
+            index=models.Index(fields=['age', 'market_value'], name='soccer_mana_age_d8b98e_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='marketlist',
+            index=models.Index(fields=['listed_at', 'id'], name='soccer_mana_listed__17b31d_idx'),
+        ),
+    ]
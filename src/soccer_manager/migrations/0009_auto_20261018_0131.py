@@ -0,0 +1,30 @@
+# Generated by Django 3.1.4 on 2026-10-18 01:31
+
+from django.db import migrations, models
+from django.db.models import Min
+import django.db.models.deletion
+
+
+def remove_duplicate_listings(apps, schema_editor):
+
+    # keep the oldest listing of each player
+    MarketList = apps.get_model('soccer_manager', 'MarketList')
+
+    first = MarketList.objects.values('player_id').annotate(first_id=Min('id')).values('first_id')
+    MarketList.objects.exclude(id__in=first).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('soccer_manager', '0008_auto_20261018_0128'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_listings, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='marketlist',
+            name='player',
+            field=models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, to='soccer_manager.player'),
+        ),
+    ]
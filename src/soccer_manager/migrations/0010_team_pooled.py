@@ -0,0 +1,31 @@
+# Generated by Django 3.1.4 on 2026-10-18 03:21
+
+from django.db import migrations, models
+
+
+def mark_pool_teams(apps, schema_editor):
+
+    # the pool was every team without owner. fill_team_pool built them unnamed and
+    # they are never listed, other teams without owner stay out of the pool
+    Team = apps.get_model('soccer_manager', 'Team')
+
+    Team.objects.filter(owner__isnull=True, name='Unnamed').exclude(player__marketlist__isnull=False).update(pooled=True)
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('soccer_manager', '0009_auto_20261018_0131'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='team',
+            name='pooled',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.RunPython(mark_pool_teams, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='team',
+            index=models.Index(fields=['pooled', 'id'], name='soccer_mana_pooled_db1efe_idx'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 3.1.4 on 2026-10-18 05:02
+
+from django.db import migrations
+
+# events.SEQUENCE
+SEQUENCE = 'soccer_manager_market_event_id'
+
+
+def create_sequence(apps, schema_editor):
+
+    # market event ids shared by the processes, see soccer_manager/events.py
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(f'CREATE SEQUENCE IF NOT EXISTS {SEQUENCE}')
+
+def drop_sequence(apps, schema_editor):
+
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(f'DROP SEQUENCE IF EXISTS {SEQUENCE}')
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('soccer_manager', '0010_team_pooled'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_sequence, drop_sequence),
+    ]
@@ -1,65 +1,181 @@
-from django.db import models
+from django.db import IntegrityError, connection, models, transaction
+from django.db.models import Count, F, Max, Min, Subquery, Sum
 from django_countries.fields import CountryField
+from accounts.authentication import states as account_states
 from accounts.models import Account
 
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
-from accounts.signals import user_logged_in
+from accounts.signals import user_logged_in, user_registered
 
-import names
-import random
-
-from django_countries.data import COUNTRIES
+from . import cache as response_cache, events, generation, leaderboard
 
 from django.core.validators import MinValueValidator
+from django.utils import timezone
 
 class Team(models.Model):
     
     class Meta:
         ordering = ['id']
+        indexes = [
+            models.Index(fields=['value', 'id']),
+            models.Index(fields=['budget', 'id']),
+            models.Index(fields=['pooled', 'id']),
+        ]
 
-    name        = models.CharField(max_length=100, default="Unnamed")
+    name        = models.CharField(max_length=100, default="Unnamed", db_index=True)
     country     = CountryField(blank_label = '(select country)')
     value       = models.FloatField(default=0, validators=[MinValueValidator(0)])
     budget      = models.FloatField(default=5000000.0, validators=[MinValueValidator(0)])    
-    owner       = models.OneToOneField(Account, on_delete=models.CASCADE)        
+    owner       = models.OneToOneField(Account, on_delete=models.CASCADE, null=True, blank=True)
+    pooled      = models.BooleanField(default=False) # built by fill_team_pool, waiting for a new user
     created     = models.DateTimeField(auto_now_add=True)
 
     def Buy(self, owner_team, player):
 
-        if player.asked_price > self.budget:
-            raise Exception(f"Team doesn't have budget to buy player id {player.id}!")
+        # the seller is checked again with the player row locked
+        if owner_team.id != player.team_id:
+            raise Exception(f"Player id {player.id} doesn't belong to team id {owner_team.id}!")
 
-        random.seed()
-        
-        # remove player from market list        
-        market_list_entry = MarketList.objects.get(player = player)        
-        market_list_entry.delete()        
+        price, value = self.BuyPlayers([player])[owner_team.id]
 
-        # transfer money
-        owner_team.budget     += player.asked_price
-        self.budget           -= player.asked_price        
-        
-        # update player value and reset asked price on market
-        player.market_value   = player.asked_price * (1 + (random.randrange(10, 100) / 100))
-        player.asked_price    = 0
-        
-        # update team
-        player.team           = self
-        
-        # update database
-        player.save()
-        owner_team.save()
-        self.save()                
-        self.UpdateTeamValue()
-        owner_team.UpdateTeamValue()
-
-    def UpdateTeamValue(self):
-
-        self.value = 0        
-        for player in Team.objects.get(id = self.id).player_set.all():
-            self.value += player.market_value
-        
-        self.save()
+        # keep the caller's instances in line with the database
+        owner_team.budget   += price
+        owner_team.value    -= value
+
+    def BuyPlayers(self, players):
+
+        # the whole purchase runs in one transaction. rows are always locked in the same
+        # order (players by id, then every team involved by id) so concurrent buys never
+        # deadlock each other, and money only moves with conditional updates. the team_id
+        # of each player is the seller the caller saw, the purchase fails if it changed.
+        #
+        # returns what each seller team received, {team id: (price, value)}
+        player_ids = [player.id for player in players]
+        if len(set(player_ids)) != len(player_ids):
+            raise Exception("A player can't be bought twice in the same purchase!")
+
+        with transaction.atomic():
+
+            locked = Player.objects.select_for_update().filter(id__in = player_ids).order_by('id').only('id', 'team_id', 'asked_price', 'market_value').in_bulk()
+            for player in players:
+                locked_player = locked.get(player.id)
+                if locked_player is None or locked_player.team_id != player.team_id:
+                    raise Exception(f"Player id {player.id} is not on the market list!")
+                if locked_player.team_id == self.id:
+                    raise Exception("You can't buy your own player!")
+
+            team_names = dict(
+                Team.objects.select_for_update().filter(id__in = {player.team_id for player in players} | {self.id}).order_by('id').values_list('id', 'name'))
+
+            # remove players from market list
+            deleted, _ = MarketList.objects.filter(player_id__in = player_ids).delete()
+            if deleted != len(player_ids):
+                listed = set(MarketList.objects.filter(player_id__in = player_ids).values_list('player_id', flat=True))
+                missing = next(player_id for player_id in player_ids if player_id not in listed)
+                raise Exception(f"Player id {missing} is not on the market list!")
+
+            # new player values, and what moves between the teams
+            rng             = generation.rng()
+            new_values      = {}
+            sellers         = {}
+            total_price     = 0
+            total_value     = 0
+            for player in players:
+                locked_player = locked[player.id]
+                new_values[player.id] = locked_player.asked_price * (1 + (rng.randrange(10, 100) / 100))
+
+                price, value = sellers.get(locked_player.team_id, (0, 0))
+                sellers[locked_player.team_id] = (price + locked_player.asked_price, value + locked_player.market_value)
+                total_price += locked_player.asked_price
+                total_value += new_values[player.id]
+
+                # sent on commit only
+                events.publish(events.SOLD, events.listing_data(
+                    player, team_names[player.team_id], asked_price = locked_player.asked_price,
+                    buyer_team_id = self.id, buyer_team_name = team_names[self.id]))
+
+            if not Team.objects.filter(id = self.id, budget__gte = total_price).update(
+                    budget = F('budget') - total_price, value = F('value') + total_value):
+                raise Exception(f"Team doesn't have budget to buy player id {', '.join(str(player_id) for player_id in player_ids)}!")
+
+            for seller_id, (price, value) in sellers.items():
+                Team.objects.filter(id = seller_id).update(budget = F('budget') + price, value = F('value') - value)
+
+            # update players value, reset asked price on market and move them to the new team
+            for locked_player in locked.values():
+                locked_player.team_id       = self.id
+                locked_player.market_value  = new_values[locked_player.id]
+                locked_player.asked_price   = 0
+            Player.objects.bulk_update(locked.values(), ['team_id', 'market_value', 'asked_price'])
+
+            response_cache.bump(
+                (response_cache.MARKETLIST,), (response_cache.TEAMS,), (response_cache.PLAYERS,),
+                *[(response_cache.TEAM, team_id) for team_id in team_names], *[(response_cache.ROSTER, team_id) for team_id in team_names],
+                *[(response_cache.PLAYER, player_id) for player_id in player_ids])
+            leaderboard.touch(*team_names)
+
+        # keep the caller's instances in line with the database
+        self.budget -= total_price
+        self.value  += total_value
+        for player in players:
+            player.market_value = new_values[player.id]
+            player.asked_price  = 0
+            player.team         = self
+
+        return sellers
+
+    @classmethod
+    def RosterSummary(cls, team_id):
+
+        # squad breakdown by position, from one query grouped by position over the
+        # team joined with its players and their listings. None if the team doesn't exist
+        rows = list(cls.objects.filter(id = team_id).values('owner_id', 'budget', 'player__position').annotate(
+            players     = Count('player'),
+            value       = Sum('player__market_value'),
+            age_sum     = Sum('player__age'),
+            min_age     = Min('player__age'),
+            max_age     = Max('player__age'),
+            listed      = Count('player__marketlist'),
+            asked_price = Sum('player__marketlist__asked_price'),
+            ).order_by())
+        if not rows:
+            return None
+
+        def summary(group):
+            players = sum(row['players'] for row in group)
+            ages    = [row for row in group if row['players']]
+            return {
+                'players': players,
+                'value': sum(row['value'] or 0 for row in group),
+                'age': {
+                    'average': sum(row['age_sum'] for row in ages) / players if players else None,
+                    'min': min((row['min_age'] for row in ages), default=None),
+                    'max': max((row['max_age'] for row in ages), default=None),
+                },
+                'listed': sum(row['listed'] for row in group),
+                'asked_price': sum(row['asked_price'] or 0 for row in group),
+            }
+
+        positions = {position: summary([row for row in rows if row['player__position'] == position]) for position in TEAM_COMPOSITION}
+        for position, required in TEAM_COMPOSITION.items():
+            positions[position]['required'] = required
+
+        return {
+            'team': team_id,
+            'owner': rows[0]['owner_id'],
+            'budget': rows[0]['budget'],
+            **summary(rows),
+            'positions': positions,
+        }
+
+    @staticmethod
+    def AddValue(team_id, delta):
+
+        if team_id and delta:
+            Team.objects.filter(id = team_id).update(value = F('value') + delta)
+            response_cache.bump((response_cache.TEAMS,), (response_cache.TEAM, team_id))
+            leaderboard.touch(team_id)
 
         
 GOALKEEPER   = "GOALKEEPER"
@@ -78,11 +194,14 @@ class Player(models.Model):
 
     class Meta:
         ordering = ['id']
+        indexes = [
+            models.Index(fields=['market_value', 'id']),
+        ]
 
     PLAYER_POSITION = [(GOALKEEPER, GOALKEEPER), (DEFENDER, DEFENDER), (MIDFIELDER, MIDFIELDER), (ATTACKER, ATTACKER)]
     
-    first_name      = models.CharField(max_length=100, default="")
-    last_name       = models.CharField(max_length=100, default="")
+    first_name      = models.CharField(max_length=100, default="", db_index=True)
+    last_name       = models.CharField(max_length=100, default="", db_index=True)
     country         = CountryField(blank_label = '(select country)')
     age             = models.IntegerField(default=0, validators=[MinValueValidator(0)])
     market_value    = models.FloatField(default=1000000.0, validators=[MinValueValidator(0)])
@@ -94,52 +213,259 @@ class Player(models.Model):
     @property
     def fullname(self):
         return f'{self.first_name} {self.last_name}'   
+
+    # team value is kept up to date with deltas applied in the same transaction
+    # as the player change, instead of rescanning the whole squad. the old team and
+    # value are read from the locked row, concurrent saves of a player apply their
+    # deltas one after the other. bulk operations (bulk_create, queryset update/delete)
+    # bypass this and must apply their own deltas
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        
+        instance = super().from_db(db, field_names, values)
+        instance._listing_state = instance._GetListingState()
+        return instance
+
+    def _GetListingState(self):
+        return tuple(self.__dict__.get(field) for field in MarketList.PLAYER_FIELDS)
+
+    def _LockValueState(self):
+
+        # called in the transaction of the change, the row stays locked until it ends
+        if self._state.adding:
+            return (None, 0)
+
+        return Player.objects.select_for_update().filter(pk = self.pk).values_list('team_id', 'market_value').first() or (None, 0)
+
+    def save(self, *args, **kwargs):
+
+        with transaction.atomic():
+
+            adding = self._state.adding
+            old_team_id, old_value = self._LockValueState()
+            super().save(*args, **kwargs)
+
+            new_team_id, new_value = self.team_id, self.market_value
+            update_fields = kwargs.get('update_fields')
+            if update_fields is not None:
+                if 'team' not in update_fields and 'team_id' not in update_fields:
+                    new_team_id = old_team_id
+                if 'market_value' not in update_fields:
+                    new_value = old_value
+
+            if old_team_id == new_team_id:
+                Team.AddValue(new_team_id, new_value - old_value)
+            else:
+                Team.AddValue(old_team_id, -old_value)
+                Team.AddValue(new_team_id, new_value)
+                if old_team_id:
+                    response_cache.bump((response_cache.ROSTER, old_team_id))
+
+            # keep the copy on the market list in sync
+            old_listing_state = getattr(self, '_listing_state', None)
+            listing_state = self._GetListingState()
+            if not adding and listing_state != old_listing_state:
+                listed = MarketList.objects.filter(player_id = self.pk).update(**MarketList.PlayerFields(self, update_fields))
+                price = MarketList.PLAYER_FIELDS.index('asked_price')
+                if listed and (old_listing_state is None or old_listing_state[price] != listing_state[price]):
+                    events.publish(events.PRICE_CHANGED, events.listing_data(self, self.team.name))
+
+        self._listing_state = listing_state
+
+    def delete(self, *args, **kwargs):
+
+        with transaction.atomic():
+
+            team_id, value = self._LockValueState()
+            result = super().delete(*args, **kwargs)
+            Team.AddValue(team_id, -value)
+
+        return result
         
 
 class MarketList(models.Model):
 
-    player = models.ForeignKey(Player, on_delete=models.CASCADE)
+    # the player fields the market list is filtered and sorted on are copied here, so
+    # MarketListFilter queries are single table index scans instead of joins.
+    # Player.save() keeps them in sync, the listing and transfer code write them directly
+    PLAYER_FIELDS = ['asked_price', 'market_value', 'position', 'age', 'country']
+
+    player          = models.OneToOneField(Player, on_delete=models.CASCADE) # a player is listed at most once
+    asked_price     = models.FloatField(default=0)
+    market_value    = models.FloatField(default=0)
+    position        = models.CharField(max_length=16, choices=Player.PLAYER_POSITION)
+    age             = models.IntegerField(default=0)
+    country         = CountryField(blank_label = '(select country)')
+    listed_at       = models.DateTimeField(auto_now_add=True)
 
     class Meta:
         ordering = ['id']
+        indexes = [
+            models.Index(fields=['asked_price', 'id']),
+            models.Index(fields=['market_value', 'id']),
+            models.Index(fields=['country', 'market_value']),
+            models.Index(fields=['position', 'asked_price']),
+            models.Index(fields=['age', 'market_value']),
+            models.Index(fields=['listed_at', 'id']),
+        ]
 
+    @classmethod
+    def PlayerFields(cls, player, fields=None):
+        return {field: getattr(player, field) for field in cls.PLAYER_FIELDS if fields is None or field in fields}
 
-@receiver(user_logged_in)
-def create_team(sender, user_id, **kwargs):
-    
-    team = Team.objects.filter(owner__id = user_id)
-    if not team:
+    @classmethod
+    def ListPlayer(cls, player, asked_price):
+
+        player.asked_price = asked_price
+        cls.ListPlayers([player])
+
+    @classmethod
+    def ListPlayers(cls, players):
+
+        # writes the asked_price set on each player and lists them, or reprices the
+        # listings already on the market, with a fixed number of statements. concurrent
+        # calls for the same player end up on the same row thanks to the unique player_id.
+        # players must be distinct and have their team loaded
+        if not players:
+            return
+
+        with transaction.atomic():
+            listed = set(cls.objects.filter(player_id__in = [player.id for player in players]).values_list('player_id', flat=True))
+            Player.objects.bulk_update(players, ['asked_price'])
+            cls._Upsert(players)
+
+            response_cache.bump(
+                (response_cache.MARKETLIST,), (response_cache.PLAYERS,), *[(response_cache.PLAYER, player.id) for player in players],
+                *{(response_cache.ROSTER, player.team_id) for player in players})
+            for player in players:
+                player._listing_state = player._GetListingState()
+                events.publish(events.PRICE_CHANGED if player.id in listed else events.LISTED, events.listing_data(player, player.team.name))
+
+    @classmethod
+    def _Upsert(cls, players):
+
+        if connection.vendor not in ('postgresql', 'sqlite'):
+            for player in players:
+                values = cls.PlayerFields(player)
+                if cls.objects.filter(player_id = player.id).update(**values):
+                    continue
+                try:
+                    with transaction.atomic():
+                        cls.objects.create(player_id = player.id, **values)
+                except IntegrityError:
+                    cls.objects.filter(player_id = player.id).update(**values)
+            return
+
+        # one multi row INSERT ... ON CONFLICT. listed_at keeps the first listing time
+        listed_at = timezone.now()
+        rows    = [dict(cls.PlayerFields(player), player = player.id, listed_at = listed_at) for player in players]
+        fields  = [cls._meta.get_field(name) for name in rows[0]]
+        quote   = connection.ops.quote_name
+        columns = ', '.join(quote(field.column) for field in fields)
+        updates = ', '.join(f'{quote(field.column)} = EXCLUDED.{quote(field.column)}' for field in fields if field.name in cls.PLAYER_FIELDS)
+        values  = ', '.join([f'({", ".join(["%s"] * len(fields))})'] * len(rows))
+        params  = [field.get_db_prep_save(row[field.name], connection) for row in rows for field in fields]
+
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'INSERT INTO {quote(cls._meta.db_table)} ({columns}) VALUES {values} '
+                f'ON CONFLICT ({quote("player_id")}) DO UPDATE SET {updates}',
+                params)
 
-        random.seed()
+def build_team(name, owner_id=None, pooled=False):
 
-        country_list = list(COUNTRIES)
-        country_list_size = len(country_list)
+    team = Team(
+        name = name,
+        country = generation.country(),
+        owner_id = owner_id,
+        pooled = pooled
+        )
 
-        user = Account.objects.get(pk=user_id)    
+    # generate the whole squad first, team value is known before touching the database
+    players = [
+        Player(**generation.player(player_position))
+        for player_position, num_players in TEAM_COMPOSITION.items()
+        for i in range(num_players)
+    ]
+    team.value = sum(player.market_value for player in players)
 
-        # create team
-        team = Team(
-            name = f"{user.first_name}'s Team",
-            country = country_list[random.randrange(0, country_list_size)],
-            owner = user
-            )
+    # 1 team insert + 1 bulk insert for the squad
+    with transaction.atomic():
+        
         team.save()
+        for player in players:
+            player.team = team
+        Player.objects.bulk_create(players)
+
+    return team
+
+def claim_team(user_id, name):
 
-        # create players
-        for player_position, num_players in TEAM_COMPOSITION.items():            
-            for i in range(num_players):
-
-                player = Player(
-                    first_name=names.get_first_name(gender='male'),
-                    last_name=names.get_last_name(),
-                    age=random.randint(18, 40),
-                    country=country_list[random.randrange(0, country_list_size)],
-                    position=player_position,
-                    team=team
-                    )
-                player.save()
-                #print(player_position + str(i))        
+    # hand the first free pool team to the user with a single update. skip locked
+    # lets concurrent claims pick different teams instead of queueing on the same row.
+    # only teams built for the pool are handed out, never one that lost its owner
+    with transaction.atomic():
+
+        pool_team = Team.objects.select_for_update(skip_locked=True).filter(pooled = True, owner__isnull = True).order_by('id').values('id')[:1]
         
-        team.UpdateTeamValue()
+        if not Team.objects.filter(pooled = True, owner__isnull = True, id__in = Subquery(pool_team)).update(owner_id = user_id, name = name, pooled = False):
+            return False
+
+        # the claimed team id isn't known here, invalidate every cached team
+        response_cache.bump((response_cache.TEAM,), (response_cache.TEAMS,))
+        drop_owner_states(None, user_id)
+        leaderboard.touch(*Team.objects.filter(owner_id = user_id).values_list('id', flat=True))
+        return True
+
+def drop_owner_states(team_id, owner_id):
+
+    # cached account states carry the team of the account. the owners the team had
+    # and has read it again, now and once the change is committed
+    def drop():
+        if team_id:
+            account_states.DropTeam(team_id)
+        if owner_id:
+            account_states.Drop(owner_id)
+
+    drop()
+    transaction.on_commit(drop)
+
+@receiver([post_save, post_delete], sender=Team)
+def drop_team_owner_states(sender, instance, **kwargs):
+    drop_owner_states(instance.id, instance.owner_id)
+
+@receiver([user_logged_in, user_registered])
+def create_team(sender, user_id, **kwargs):
+    
+    if Team.objects.filter(owner_id = user_id).exists():
+        return
+
+    first_name = Account.objects.values_list('first_name', flat=True).get(pk=user_id)
+    name = f"{first_name}'s Team"
+
+    try:
+        # pool is empty, build the team inline
+        if not claim_team(user_id, name):
+            build_team(name, owner_id = user_id)
+    except IntegrityError:
+        # a concurrent login of the same user got a team first
+        pass
+
+
+# queryset updates don't send these, the code doing them bumps the versions itself
+
+@receiver([post_save, post_delete], sender=MarketList)
+def invalidate_marketlist(sender, **kwargs):
+
+    # the team of the listed player isn't loaded here, invalidate every roster
+    response_cache.bump((response_cache.MARKETLIST,), (response_cache.ROSTER,))
+
+@receiver([post_save, post_delete], sender=Player)
+def invalidate_player(sender, instance, **kwargs):
+    response_cache.bump((response_cache.MARKETLIST,), (response_cache.PLAYERS,), (response_cache.PLAYER, instance.id), (response_cache.ROSTER, instance.team_id))
 
-    #print("user logged in " + str(user_id))
\ No newline at end of file
+@receiver([post_save, post_delete], sender=Team)
+def invalidate_team(sender, instance, **kwargs):
+    response_cache.bump((response_cache.MARKETLIST,), (response_cache.TEAMS,), (response_cache.TEAM, instance.id))
+    leaderboard.touch(instance.id)
@@ -1,14 +1,43 @@
+import asyncio
 import json
-
+import threading
+import time
+from base64 import urlsafe_b64encode
+from io import StringIO
+from unittest import mock
+
+from asgiref.sync import async_to_sync
+from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import call_command
+from django.db import IntegrityError, connection, transaction
+from django.db.models import F
+from django.test import SimpleTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from rest_framework import status
 from rest_framework.authtoken.models import Token
+from rest_framework.generics import GenericAPIView
+from rest_framework.renderers import JSONRenderer
 from rest_framework.reverse import reverse as api_reverse
 from rest_framework.test import APITestCase
 
-from .models import create_team, Team, Player, MarketList
+from . import events, generation, leaderboard
+from .api import events as market_events
+from .models import build_team, create_team, Team, Player, MarketList, TEAM_COMPOSITION
 from accounts.models import Account
+from .api.conditional import ConditionalGetMixin
+from .api.rows import row_serializer
+from .api.views import MarketListListCreateAPIView, PlayerListCreateAPIView, TeamListCreateAPIView, TeamRUDAPIView
+from .api.serializers import (
+    MarketListDetailSerializer,
+    PlayerAdminUserSerializer,
+    PlayerMarketListUserSerializer,
+    TeamAdminUserSerializer,
+)
+from common.pagination import KeysetPagination, estimate_count
 
 User = get_user_model()
 
@@ -380,6 +409,28 @@ class TeamTestAPI(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)      
         self.assertEqual(response.data['name'], new_name)       
 
+    def test_team_update_keeps_concurrent_budget_changes(self):
+
+        team        = Team.objects.get(owner = self.user.pk)
+        get_object  = TeamRUDAPIView.get_object
+
+        # a purchase commits between the read of the team and its save
+        def read_then_buy(view):
+            instance = get_object(view)
+            Team.objects.filter(id = team.id).update(budget = F('budget') - 1000, value = F('value') + 1000)
+            return instance
+
+        with mock.patch.object(TeamRUDAPIView, 'get_object', read_then_buy):
+            response = self.client.patch(
+                api_reverse('soccer-manager:team-rud', kwargs={'id': str(team.id)}), 
+                HTTP_AUTHORIZATION='Bearer ' + self.user.tokens()['access'],            
+                data={'name': 'Muller Team'},
+            )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        updated = Team.objects.get(id = team.id)
+        self.assertEqual((updated.name, updated.budget, updated.value), ('Muller Team', team.budget - 1000, team.value + 1000))
+
     def test_team_update_user_team_unallowed_field(self):
          
         team = Team.objects.get(owner = self.user.pk)        
@@ -676,4 +727,1661 @@ class MarketListTestAPI(APITestCase):
             HTTP_AUTHORIZATION='Bearer ' + self.user2.tokens()['access'],                       
         )                        
         self.assertEqual(response.status_code, status.HTTP_405_METHOD_NOT_ALLOWED)
-        
\ No newline at end of file
+        
+class TransferTestCase(APITestCase):
+
+    def setUp(self):
+
+        self.seller_user    = User.objects.create_user('John', 'Seller', 'seller@soccer.com', 'abc1234')
+        self.buyer_user     = User.objects.create_user('John', 'Buyer', 'buyer@soccer.com', 'abc1234')
+
+        create_team(sender=None, user_id=self.seller_user.id)
+        create_team(sender=None, user_id=self.buyer_user.id)
+
+        self.seller = Team.objects.get(owner=self.seller_user)
+        self.buyer  = Team.objects.get(owner=self.buyer_user)
+
+    def _ListPlayer(self, team, asked_price):
+
+        player = team.player_set.first()
+        player.asked_price = asked_price
+        player.save()
+        MarketList.objects.create(player=player, **MarketList.PlayerFields(player))
+
+        return player
+
+    def test_buy_moves_money_and_player(self):
+
+        player = self._ListPlayer(self.seller, 100000)
+
+        self.buyer.Buy(self.seller, player)
+
+        player = Player.objects.get(id=player.id)
+        self.assertEqual(player.team_id, self.buyer.id)
+        self.assertEqual(player.asked_price, 0)
+        self.assertGreater(player.market_value, 100000)
+        self.assertEqual(Team.objects.get(id=self.seller.id).budget, 5000000 + 100000)
+        self.assertEqual(Team.objects.get(id=self.buyer.id).budget, 5000000 - 100000)
+        self.assertFalse(MarketList.objects.filter(player=player).exists())
+
+    def test_buy_without_budget_changes_nothing(self):
+
+        player = self._ListPlayer(self.seller, 100000)
+        Team.objects.filter(id=self.buyer.id).update(budget=1000)
+
+        with self.assertRaises(Exception):
+            self.buyer.Buy(self.seller, player)
+
+        self.assertEqual(Player.objects.get(id=player.id).team_id, self.seller.id)
+        self.assertEqual(Team.objects.get(id=self.seller.id).budget, 5000000)
+        self.assertEqual(Team.objects.get(id=self.buyer.id).budget, 1000)
+        self.assertTrue(MarketList.objects.filter(player=player).exists())
+
+    def test_buy_player_not_on_market(self):
+
+        player = self.seller.player_set.first()
+
+        with self.assertRaises(Exception):
+            self.buyer.Buy(self.seller, player)
+
+        self.assertEqual(Player.objects.get(id=player.id).team_id, self.seller.id)
+
+    def test_buy_from_the_wrong_seller(self):
+
+        player = self._ListPlayer(self.seller, 100000)
+
+        with self.assertRaisesMessage(Exception, "doesn't belong to team"):
+            self.buyer.Buy(self.buyer, player)
+
+        self.assertEqual(Player.objects.get(id=player.id).team_id, self.seller.id)
+        self.assertTrue(MarketList.objects.filter(player=player).exists())
+
+    def test_buy_query_count_independent_of_squad_size(self):
+
+        player = self._ListPlayer(self.seller, 100000)
+        with CaptureQueriesContext(connection) as small_squad:
+            self.buyer.Buy(self.seller, player)
+
+        create_team(sender=None, user_id=User.objects.create_user('John', 'Big', 'big@soccer.com', 'abc1234').id)
+        big_team = Team.objects.get(owner__email='big@soccer.com')
+        Player.objects.filter(team=self.buyer).update(team=big_team)
+
+        player = self._ListPlayer(self.seller, 100000)
+        with CaptureQueriesContext(connection) as big_squad:
+            big_team.Buy(self.seller, player)
+
+        self.assertEqual(len(small_squad), len(big_squad))
+
+
+class TeamValueTestCase(APITestCase):
+
+    def setUp(self):
+
+        self.admin_user = User.objects.create_superuser('John', 'Admin', 'admin@soccer.com', 'abc1234')
+        create_team(sender=None, user_id=self.admin_user.id)
+        self.team = Team.objects.get(owner=self.admin_user)
+
+    def _TeamValue(self):
+        return Team.objects.get(id=self.team.id).value
+
+    def _PlayersValue(self):
+        return sum(Player.objects.filter(team=self.team).values_list('market_value', flat=True))
+
+    def test_team_value_after_create_team(self):
+        self.assertAlmostEqual(self._TeamValue(), self._PlayersValue())
+
+    def test_team_value_on_player_create_update_delete(self):
+
+        data = {
+            'first_name': 'Neymar',
+            'last_name': 'Junior', 
+            'country': 'BR',
+            'team': self.team.id,
+            'age': 28,
+            'market_value': 2000000,
+            'position': 'ATTACKER'
+            }        
+        response = self.client.post(
+            api_reverse('soccer-manager:player-list-create'), 
+            HTTP_AUTHORIZATION='Bearer ' + self.admin_user.tokens()['access'],
+            data=data
+        )        
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertAlmostEqual(self._TeamValue(), self._PlayersValue())
+
+        response = self.client.patch(
+            api_reverse('soccer-manager:player-rud', kwargs={'id': response.data['id']}), 
+            HTTP_AUTHORIZATION='Bearer ' + self.admin_user.tokens()['access'],
+            data={'market_value': 3500000}
+        )        
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertAlmostEqual(self._TeamValue(), self._PlayersValue())
+
+        response = self.client.delete(
+            api_reverse('soccer-manager:player-rud', kwargs={'id': response.data['id']}), 
+            HTTP_AUTHORIZATION='Bearer ' + self.admin_user.tokens()['access'],
+        )        
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertAlmostEqual(self._TeamValue(), self._PlayersValue())
+
+    def test_team_value_on_player_moved(self):
+
+        other_user = User.objects.create_user('John', 'Other', 'other@soccer.com', 'abc1234')
+        create_team(sender=None, user_id=other_user.id)
+        other_team = Team.objects.get(owner=other_user)
+
+        player = Player.objects.filter(team=self.team).first()
+        player.team = other_team
+        player.save()
+
+        self.assertAlmostEqual(self._TeamValue(), self._PlayersValue())
+        self.assertAlmostEqual(Team.objects.get(id=other_team.id).value, 21 * 1000000)
+
+    def test_team_value_on_stale_instances(self):
+
+        # two edits of the same player loaded before either saved
+        player_id = Player.objects.filter(team=self.team).first().id
+        first, second = Player.objects.get(id=player_id), Player.objects.get(id=player_id)
+
+        first.market_value = 3000000
+        first.save()
+        second.market_value = 5000000
+        second.save()
+
+        self.assertAlmostEqual(self._TeamValue(), self._PlayersValue())
+
+        first.delete()
+        self.assertAlmostEqual(self._TeamValue(), self._PlayersValue())
+
+    def test_reconcile_team_values(self):
+
+        Team.objects.filter(id=self.team.id).update(value=0)
+
+        call_command('reconcile_team_values', chunk_size=1, stdout=StringIO())
+
+        self.assertAlmostEqual(self._TeamValue(), self._PlayersValue())
+
+
+class CreateTeamTestCase(APITestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('John', 'Verified', 'user@soccer.com', 'abc1234')
+
+    def test_create_team(self):
+
+        create_team(sender=None, user_id=self.user.id)
+
+        team = Team.objects.get(owner=self.user)
+        self.assertEqual(team.name, "John's Team")
+        for position, num_players in TEAM_COMPOSITION.items():
+            self.assertEqual(team.player_set.filter(position=position).count(), num_players)
+        self.assertAlmostEqual(team.value, sum(team.player_set.values_list('market_value', flat=True)))
+
+    def test_create_team_once(self):
+
+        create_team(sender=None, user_id=self.user.id)
+        create_team(sender=None, user_id=self.user.id)
+
+        self.assertEqual(Team.objects.filter(owner=self.user).count(), 1)
+        self.assertEqual(Player.objects.count(), sum(TEAM_COMPOSITION.values()))
+
+    def test_create_team_query_count(self):
+
+        with CaptureQueriesContext(connection) as queries:
+            create_team(sender=None, user_id=self.user.id)
+
+        # exists check, owner name, pool claim, team insert, squad bulk insert
+        statements = [query for query in queries if 'SAVEPOINT' not in query['sql']]
+        self.assertEqual(len(statements), 5)
+
+    def test_create_team_from_pool(self):
+
+        call_command('fill_team_pool', size=2, stdout=StringIO())
+        pool_team_ids = set(Team.objects.filter(owner__isnull=True).values_list('id', flat=True))
+        players_count = Player.objects.count()
+        self.assertEqual(len(pool_team_ids), 2)
+
+        create_team(sender=None, user_id=self.user.id)
+
+        team = Team.objects.get(owner=self.user)
+        self.assertIn(team.id, pool_team_ids)
+        self.assertEqual(team.name, "John's Team")
+        self.assertEqual(Player.objects.count(), players_count)
+        self.assertEqual(Team.objects.filter(owner__isnull=True).count(), 1)
+
+    def test_only_pool_teams_are_claimed(self):
+
+        # a team that lost its owner keeps its squad and budget, it must not be handed out
+        admin_user = User.objects.create_superuser('John', 'Admin', 'admin@soccer.com', 'abc1234')
+        create_team(sender=None, user_id=admin_user.id)
+        orphan = Team.objects.get(owner=admin_user)
+        Team.objects.filter(id=orphan.id).update(owner=None)
+
+        create_team(sender=None, user_id=self.user.id)
+        team = Team.objects.get(owner=self.user)
+        self.assertNotEqual(team.id, orphan.id)
+        self.assertEqual(team.player_set.count(), sum(TEAM_COMPOSITION.values()))
+
+        call_command('fill_team_pool', size=1, stdout=StringIO())
+        self.assertEqual(Team.objects.filter(pooled=True).count(), 1)
+
+    def test_admin_teams_need_an_owner(self):
+
+        admin_user  = User.objects.create_superuser('John', 'Admin', 'admin@soccer.com', 'abc1234')
+        token       = admin_user.tokens()['access']
+        create_team(sender=None, user_id=self.user.id)
+
+        response = self.client.post(
+            api_reverse('soccer-manager:team-list-create'), 
+            HTTP_AUTHORIZATION='Bearer ' + token,
+            data={'name': 'Test Team', 'country': 'BR'},
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('owner', response.data)
+
+        team = Team.objects.get(owner=self.user)
+        response = self.client.patch(
+            api_reverse('soccer-manager:team-rud', kwargs={'id': team.id}), 
+            HTTP_AUTHORIZATION='Bearer ' + token,
+            data={'owner': None},
+            format='json',
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(Team.objects.get(id=team.id).owner_id, self.user.id)
+
+    def test_pool_teams_not_listed(self):
+
+        call_command('fill_team_pool', size=2, stdout=StringIO())
+        create_team(sender=None, user_id=self.user.id)
+
+        response = self.client.get(
+            api_reverse('soccer-manager:team-list-create'), 
+            HTTP_AUTHORIZATION='Bearer ' + self.user.tokens()['access'],
+        )        
+        self.assertEqual(response.status_code, status.HTTP_200_OK)  
+        self.assertEqual(response.data['count'], 1)
+
+
+class GenerationTestCase(SimpleTestCase):
+
+    def tearDown(self):
+        generation.seed(None)
+
+    def _Sample(self):
+        return [generation.player(position) for position in TEAM_COMPOSITION]
+
+    def test_seed_is_reproducible(self):
+
+        generation.seed(42)
+        first_sample = self._Sample()
+        generation.seed(42)
+
+        self.assertEqual(first_sample, self._Sample())
+
+    def test_seeded_threads_get_their_own_stream(self):
+
+        def sample(samples):
+            samples.append(self._Sample())
+
+        generation.seed(42)
+        first_sample = self._Sample()
+
+        samples = []
+        threads = [threading.Thread(target=sample, args=(samples,)) for i in range(2)]
+        for thread in threads:
+            thread.start()
+            thread.join()
+
+        self.assertNotEqual(samples[0], samples[1])
+        self.assertNotIn(first_sample, samples)
+
+    def test_player_fields(self):
+
+        for player in self._Sample():
+            self.assertTrue(player['first_name'].istitle())
+            self.assertTrue(player['last_name'].istitle())
+            self.assertIn(player['country'], generation.COUNTRY_CODES)
+            self.assertGreaterEqual(player['age'], generation.MIN_PLAYER_AGE)
+            self.assertLessEqual(player['age'], generation.MAX_PLAYER_AGE)
+
+
+class GenerateLoadDataTestCase(APITestCase):
+
+    def test_generate_load_data(self):
+
+        call_command('generate_load_data', 3, seed='1', listed_ratio=0.5, batch_size=2, stdout=StringIO())
+
+        self.assertEqual(Account.objects.count(), 3)
+        self.assertEqual(Team.objects.count(), 3)
+        self.assertEqual(Player.objects.count(), 3 * sum(TEAM_COMPOSITION.values()))
+        self.assertGreater(MarketList.objects.count(), 0)
+
+        for team in Team.objects.all():
+            self.assertAlmostEqual(team.value, sum(team.player_set.values_list('market_value', flat=True)))
+            for position, num_players in TEAM_COMPOSITION.items():
+                self.assertEqual(team.player_set.filter(position=position).count(), num_players)
+
+        for listing in MarketList.objects.select_related('player'):
+            self.assertGreaterEqual(listing.player.asked_price, listing.player.market_value)
+
+        # generated accounts can log in
+        response = self.client.post(
+            api_reverse('accounts-api:login'),
+            data={'email': Account.objects.first().email, 'password': 'loadtest'}
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+
+class MarketListQueryTestCase(APITestCase):
+
+    def setUp(self):
+
+        self.user = User.objects.create_user('John', 'Verified', 'user@soccer.com', 'abc1234')
+        create_team(sender=None, user_id=self.user.id)
+        self.team = Team.objects.get(owner=self.user)
+        self.access_token = self.user.tokens()['access']
+
+    def _ListPlayers(self, count):
+
+        for player in self.team.player_set.filter(marketlist__isnull=True)[:count]:
+            MarketList.objects.create(player=player, **MarketList.PlayerFields(player))
+
+    def _GetMarketList(self, num_queries, **params):
+
+        # account state (first request only), count and one joined page query
+        with self.assertNumQueries(num_queries):
+            response = self.client.get(
+                api_reverse('soccer-manager:marketlist-list-create'), 
+                params,
+                HTTP_AUTHORIZATION='Bearer ' + self.access_token,
+            )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        return response
+
+    def test_marketlist_query_count_per_page(self):
+
+        self._ListPlayers(2)
+        self._GetMarketList(3)
+
+        self._ListPlayers(10)
+        response = self._GetMarketList(2)
+        self.assertEqual(len(response.data['results']), 10)
+
+        response = self._GetMarketList(2, team_name='John')
+        self.assertEqual(response.data['count'], 12)
+
+    def test_marketlist_player_fields(self):
+
+        self._ListPlayers(1)
+        response = self._GetMarketList(3)
+
+        player = MarketList.objects.get().player
+        self.assertEqual(response.data['results'][0]['player'], PlayerMarketListUserSerializer(player).data)
+
+
+class KeysetPaginationTestCase(APITestCase):
+
+    def setUp(self):
+
+        self.admin_user = User.objects.create_superuser('John', 'Admin', 'admin@soccer.com', 'abc1234')
+        self.access_token = self.admin_user.tokens()['access']
+        create_team(sender=None, user_id=self.admin_user.id)
+
+        # ties on market value must not break the pages
+        for i, player in enumerate(Player.objects.all()):
+            player.market_value = 1000000 + (i % 3) * 1000
+            player.save()
+
+    def _Get(self, url, **params):
+
+        response = self.client.get(url, params, HTTP_AUTHORIZATION='Bearer ' + self.access_token)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        return response.data
+
+    def _Walk(self, url, **params):
+
+        pages = [self._Get(url, cursor='', **params)]
+        while pages[-1]['next']:
+            pages.append(self._Get(pages[-1]['next']))
+
+        return pages
+
+    def test_cursor_pages(self):
+
+        pages = self._Walk(api_reverse('soccer-manager:player-list-create'))
+
+        self.assertNotIn('count', pages[0])
+        self.assertIsNone(pages[0]['previous'])
+        ids = [player['id'] for page in pages for player in page['results']]
+        self.assertEqual(ids, list(Player.objects.order_by('id').values_list('id', flat=True)))
+
+    def test_cursor_pages_sorted_by_value(self):
+
+        pages = self._Walk(api_reverse('soccer-manager:player-list-create'), ordering='-market_value')
+
+        ids = [player['id'] for page in pages for player in page['results']]
+        self.assertEqual(ids, list(Player.objects.order_by('-market_value', '-id').values_list('id', flat=True)))
+
+    @mock.patch.object(KeysetPagination, 'page_size', 3)
+    def test_cursor_pages_of_every_ordering(self):
+
+        for i in range(3):
+            user = User.objects.create_user('John', f'User{i}', f'user{i}@soccer.com', 'abc1234')
+            create_team(sender=None, user_id=user.id)
+        for player in Player.objects.order_by('id')[:7]:
+            MarketList.objects.create(player=player, **MarketList.PlayerFields(player))
+
+        views = [
+            (api_reverse('soccer-manager:player-list-create'), PlayerListCreateAPIView, Player.objects.values_list('id', flat=True)),
+            (api_reverse('soccer-manager:team-list-create'), TeamListCreateAPIView, Team.objects.filter(owner__isnull=False).values_list('id', flat=True)),
+            (api_reverse('soccer-manager:marketlist-list-create'), MarketListListCreateAPIView, MarketList.objects.values_list('player_id', flat=True)),
+        ]
+        for url, view, queryset in views:
+            for name, field in view.keyset_ordering_fields.items():
+                for ordering, order_by in ((name, (field, 'id')), ('-' + name, ('-' + field, '-id'))):
+
+                    pages = self._Walk(url, ordering=ordering)
+                    self.assertGreater(len(pages), 1, (url, ordering))
+                    ids = [row.get('id') or row['player']['id'] for page in pages for row in page['results']]
+                    self.assertEqual(ids, list(queryset.order_by(*order_by)), (url, ordering))
+
+                    previous = self._Get(pages[-1]['previous'])
+                    self.assertEqual(previous['results'], pages[-2]['results'])
+
+    def test_cursor_previous_page(self):
+
+        pages = self._Walk(api_reverse('soccer-manager:player-list-create'), ordering='market_value')
+
+        previous = self._Get(pages[1]['previous'])
+        self.assertEqual(previous['results'], pages[0]['results'])
+
+    def test_invalid_cursor(self):
+
+        response = self.client.get(
+            api_reverse('soccer-manager:team-list-create'),
+            {'cursor': 'nonsense'},
+            HTTP_AUTHORIZATION='Bearer ' + self.access_token
+        )
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_invalid_cursor_position(self):
+
+        def cursor(position):
+            return urlsafe_b64encode(json.dumps({'r': 0, 'p': position}).encode('ascii')).decode('ascii')
+
+        url = api_reverse('soccer-manager:player-list-create')
+        for params in ({'cursor': cursor(['abc'])}, {'cursor': cursor([])}, {'cursor': cursor([1, 2])},
+                       {'cursor': cursor([None])}, {'cursor': cursor(['abc', 1]), 'ordering': 'market_value'}):
+            response = self.client.get(url, params, HTTP_AUTHORIZATION='Bearer ' + self.access_token)
+            self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+            self.assertEqual(response.data['detail'], 'Invalid cursor')
+
+    def test_pages_without_count(self):
+
+        url = api_reverse('soccer-manager:player-list-create')
+        with CaptureQueriesContext(connection) as queries:
+            first = self._Get(url, count='none')
+        self.assertFalse(any('COUNT' in query['sql'] for query in queries))
+        self.assertNotIn('count', first)
+        self.assertIsNone(first['previous'])
+
+        pages = [first]
+        while pages[-1]['next']:
+            pages.append(self._Get(pages[-1]['next']))
+
+        self.assertEqual(len(pages), 2)
+        self.assertEqual(self._Get(pages[1]['previous']), first)
+        ids = [player['id'] for page in pages for player in page['results']]
+        self.assertEqual(ids, list(Player.objects.order_by('id').values_list('id', flat=True)))
+
+        response = self.client.get(url, {'count': 'none', 'page': 3}, HTTP_AUTHORIZATION='Bearer ' + self.access_token)
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_estimated_count(self):
+
+        # no planner statistics on sqlite, small results are counted anyway
+        data = self._Get(api_reverse('soccer-manager:player-list-create'), count='estimate')
+        self.assertEqual(data['count'], 20)
+        self.assertFalse(data['estimated'])
+        if connection.vendor != 'postgresql':
+            self.assertIsNone(estimate_count(Player.objects.all()))
+
+
+class MarketListSearchTestCase(APITestCase):
+
+    def setUp(self):
+
+        self.user = User.objects.create_user('John', 'Verified', 'user@soccer.com', 'abc1234')
+        self.access_token = self.user.tokens()['access']
+        create_team(sender=None, user_id=self.user.id)
+
+        players = list(Team.objects.get(owner=self.user).player_set.all()[:3])
+        for player, (first_name, last_name, country) in zip(players, [('Diego', 'Maradona', 'AR'), ('Diego', 'Costa', 'ES'), ('Lionel', 'Messi', 'AR')]):
+            player.first_name, player.last_name, player.country = first_name, last_name, country
+            player.save()
+            MarketList.objects.create(player=player, **MarketList.PlayerFields(player))
+
+    def _Search(self, **params):
+
+        response = self.client.get(
+            api_reverse('soccer-manager:marketlist-list-create'),
+            params,
+            HTTP_AUTHORIZATION='Bearer ' + self.access_token
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        return sorted(item['player']['last_name'] for item in response.data['results'])
+
+    def test_search(self):
+
+        self.assertEqual(self._Search(search='diego'), ['Costa', 'Maradona'])
+        self.assertEqual(self._Search(search='diego mara'), ['Maradona'])
+        self.assertEqual(self._Search(search="john's"), ['Costa', 'Maradona', 'Messi'])
+        self.assertEqual(self._Search(search='zidane'), [])
+
+    def test_search_with_other_filters(self):
+
+        self.assertEqual(self._Search(search='diego', country='AR'), ['Maradona'])
+        self.assertEqual(self._Search(name='Diego', country='ES'), ['Costa'])
+
+    def test_search_without_cursor(self):
+
+        # ranked results can't be walked by keyset pages
+        response = self.client.get(
+            api_reverse('soccer-manager:marketlist-list-create'),
+            {'search': 'diego', 'cursor': ''},
+            HTTP_AUTHORIZATION='Bearer ' + self.access_token
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('cursor', response.data)
+
+        self.assertEqual(self._Search(search='', cursor=''), ['Costa', 'Maradona', 'Messi'])
+
+
+class MarketListDenormalizedTestCase(APITestCase):
+
+    def setUp(self):
+
+        self.admin_user = User.objects.create_superuser('John', 'Admin', 'admin@soccer.com', 'abc1234')
+        self.access_token = self.admin_user.tokens()['access']
+        create_team(sender=None, user_id=self.admin_user.id)
+        self.player = Team.objects.get(owner=self.admin_user).player_set.first()
+
+        response = self.client.post(
+            api_reverse('soccer-manager:marketlist-list-create'), 
+            HTTP_AUTHORIZATION='Bearer ' + self.access_token,
+            data={'player_id': self.player.id, 'asked_price': 1500000}
+        )        
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+    def _AssertListingInSync(self):
+
+        listing = MarketList.objects.get(player_id=self.player.id)
+        player = Player.objects.get(id=self.player.id)
+        for field in MarketList.PLAYER_FIELDS:
+            self.assertEqual(getattr(listing, field), getattr(player, field))
+
+    def test_listing_copies_player_fields(self):
+
+        self._AssertListingInSync()
+        self.assertEqual(MarketList.objects.get(player_id=self.player.id).asked_price, 1500000)
+
+    def test_player_update_syncs_listing(self):
+
+        response = self.client.patch(
+            api_reverse('soccer-manager:player-rud', kwargs={'id': self.player.id}), 
+            HTTP_AUTHORIZATION='Bearer ' + self.access_token,
+            data={'market_value': 2500000, 'age': 33, 'country': 'PT'}
+        )        
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self._AssertListingInSync()
+
+    def test_filters_use_marketlist_table(self):
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(
+                api_reverse('soccer-manager:marketlist-list-create'),
+                {'country': self.player.country.code, 'min_value': 1, 'max_age': 40, 'position': self.player.position},
+                HTTP_AUTHORIZATION='Bearer ' + self.access_token
+            )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['count'], 1)
+
+        count_query = next(query['sql'] for query in queries if 'COUNT' in query['sql'])
+        self.assertNotIn('JOIN', count_query)
+
+    def test_relisting_updates_the_listing(self):
+
+        listed_at = MarketList.objects.get(player_id=self.player.id).listed_at
+        response = self.client.post(
+            api_reverse('soccer-manager:marketlist-list-create'), 
+            HTTP_AUTHORIZATION='Bearer ' + self.access_token,
+            data={'player_id': self.player.id, 'asked_price': 2000000}
+        )        
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        listing = MarketList.objects.get(player_id=self.player.id)
+        self.assertEqual(listing.asked_price, 2000000)
+        self.assertEqual(listing.listed_at, listed_at)
+        self._AssertListingInSync()
+
+    def test_listing_is_unique_per_player(self):
+
+        with self.assertRaises(IntegrityError):
+            with transaction.atomic():
+                MarketList.objects.create(player=self.player, **MarketList.PlayerFields(self.player))
+
+
+class ResponseCacheTestCase(APITestCase):
+
+    def setUp(self):
+
+        cache.clear()
+
+        self.admin_user = User.objects.create_superuser('John', 'Admin', 'admin@soccer.com', 'abc1234')
+        self.user       = User.objects.create_user('John', 'Verified', 'user@soccer.com', 'abc1234')
+        create_team(sender=None, user_id=self.admin_user.id)
+        create_team(sender=None, user_id=self.user.id)
+
+        self.admin_token    = self.admin_user.tokens()['access']
+        self.user_token     = self.user.tokens()['access']
+        self.team           = Team.objects.get(owner=self.user)
+        self.player         = self.team.player_set.first()
+
+    def _Get(self, url, token):
+        return self.client.get(url, HTTP_AUTHORIZATION='Bearer ' + token)
+
+    def _List(self, player):
+
+        response = self.client.post(
+            api_reverse('soccer-manager:marketlist-list-create'), 
+            HTTP_AUTHORIZATION='Bearer ' + self.user_token,
+            data={'player_id': player.id, 'asked_price': 1000}
+        )        
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+    def test_marketlist_hit_skips_the_database(self):
+
+        url = api_reverse('soccer-manager:marketlist-list-create')
+        self._List(self.player)
+
+        response = self._Get(url, self.user_token)
+        self.assertEqual(response['X-Cache'], 'MISS')
+
+        # only the authenticated user is read
+        with self.assertNumQueries(1):
+            response = self._Get(url, self.admin_token)
+        self.assertEqual(response['X-Cache'], 'HIT')
+        self.assertEqual(response.data['count'], 1)
+
+        # other filters are other entries
+        response = self.client.get(url, {'position': 'NONE'}, HTTP_AUTHORIZATION='Bearer ' + self.user_token)
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.data['count'], 0)
+
+    def test_listing_invalidates_marketlist(self):
+
+        url = api_reverse('soccer-manager:marketlist-list-create')
+        self.assertEqual(self._Get(url, self.user_token).data['count'], 0)
+
+        self._List(self.player)
+
+        response = self._Get(url, self.user_token)
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.data['count'], 1)
+
+    def test_buy_invalidates_teams(self):
+
+        self._List(self.player)
+        admin_team  = Team.objects.get(owner=self.admin_user)
+        url         = api_reverse('soccer-manager:team-rud', kwargs={'id': admin_team.id})
+
+        self._Get(url, self.admin_token)
+        self.assertEqual(self._Get(url, self.admin_token)['X-Cache'], 'HIT')
+
+        response = self.client.patch(
+            api_reverse('soccer-manager:marketlist-ru', kwargs={'id': self.player.id}), 
+            HTTP_AUTHORIZATION='Bearer ' + self.admin_token,
+            data={'team': admin_team.id}
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        response = self._Get(url, self.admin_token)
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.data['budget'], admin_team.budget - 1000)
+
+    def test_cached_team_checks_owner(self):
+
+        other_user = User.objects.create_user('Jane', 'Other', 'other@soccer.com', 'abc1234')
+
+        # the same refusal whether the response is built or read from the cache
+        for name in ('team-rud', 'team-roster'):
+            url = api_reverse('soccer-manager:' + name, kwargs={'id': self.team.id})
+            miss = self._Get(url, other_user.tokens()['access'])
+            self.assertEqual(miss.status_code, status.HTTP_403_FORBIDDEN)
+            self.assertEqual(self._Get(url, self.admin_token).status_code, status.HTTP_200_OK)
+
+            hit = self._Get(url, other_user.tokens()['access'])
+            self.assertEqual((hit.status_code, hit.data), (miss.status_code, miss.data))
+            self.assertEqual(self._Get(url, self.user_token).status_code, status.HTTP_200_OK)
+
+    @override_settings(RESPONSE_CACHE_TIMEOUT=0)
+    def test_stale_entry_served_while_rebuilding(self):
+
+        url = api_reverse('soccer-manager:marketlist-list-create')
+        self._Get(url, self.user_token)
+
+        # the first request after expiry rebuilds, the others get the stale page meanwhile
+        with mock.patch.object(cache, 'delete'):
+            self.assertEqual(self._Get(url, self.user_token)['X-Cache'], 'MISS')
+            self.assertEqual(self._Get(url, self.user_token)['X-Cache'], 'STALE')
+
+    def test_stats(self):
+
+        url = api_reverse('soccer-manager:marketlist-list-create')
+        self._Get(url, self.user_token)
+        self._Get(url, self.user_token)
+
+        response = self._Get(api_reverse('soccer-manager:cache-stats'), self.admin_token)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['marketlist'], {'hit': 1, 'stale': 0, 'miss': 1})
+
+        response = self._Get(api_reverse('soccer-manager:cache-stats'), self.user_token)
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+
+@mock.patch('soccer_manager.events.transaction.on_commit', lambda callback: callback())
+class MarketEventsTestCase(APITestCase):
+
+    def setUp(self):
+
+        self.user = User.objects.create_user('John', 'Verified', 'user@soccer.com', 'abc1234')
+        create_team(sender=None, user_id=self.user.id)
+        self.access_token = self.user.tokens()['access']
+        self.team = Team.objects.get(owner=self.user)
+
+    def _Stream(self, query='', headers=(), publish=()):
+
+        # runs the stream until the published events went through, then disconnects
+        async def run():
+
+            sent        = []
+            disconnect  = asyncio.Event()
+
+            async def receive():
+                await disconnect.wait()
+                return {'type': 'http.disconnect'}
+
+            async def send(message):
+                sent.append(message)
+
+            scope = {
+                'type': 'http',
+                'method': 'GET',
+                'path': market_events.PATH,
+                'query_string': query.encode(),
+                'headers': [(b'authorization', b'Bearer ' + self.access_token.encode())] + list(headers),
+            }
+            stream = asyncio.ensure_future(market_events.market_events(scope, receive, send))
+            while not sent:
+                await asyncio.sleep(0.01)
+            for event_type, data in publish:
+                events.broker.Publish(event_type, data)
+            for _ in range(20):
+                await asyncio.sleep(0)
+
+            disconnect.set()
+            await stream
+            return sent
+
+        sent = async_to_sync(run)()
+        return sent[0]['status'], b''.join(message.get('body', b'') for message in sent[1:]).decode()
+
+    def _Data(self, **fields):
+
+        data = {
+            'player_id': 1, 'first_name': 'Diego', 'last_name': 'Maradona', 'team_id': 1, 'team_name': 'Napoli',
+            'asked_price': 1000.0, 'market_value': 2000.0, 'position': 'ATTACKER', 'age': 25, 'country': 'AR',
+        }
+        data.update(fields)
+        return data
+
+    def test_stream_filters_events(self):
+
+        status_code, body = self._Stream('country=AR&min_price=500&name=Die', publish=[
+            (events.LISTED, self._Data()),
+            (events.LISTED, self._Data(player_id=2, country='BR')),
+            (events.SOLD, self._Data(player_id=3, asked_price=100.0)),
+            (events.PRICE_CHANGED, self._Data(player_id=4, first_name='Lionel')),
+        ])
+        self.assertEqual(status_code, 200)
+        self.assertEqual(body.count('event: '), 1)
+        self.assertIn('event: listed', body)
+        self.assertIn('"player_id": 1', body)
+
+    def test_resume_from_last_event_id(self):
+
+        first = events.broker.Publish(events.LISTED, self._Data())
+        events.broker.Publish(events.SOLD, self._Data())
+
+        status_code, body = self._Stream(headers=[(b'last-event-id', str(first['id']).encode())])
+        self.assertEqual(status_code, 200)
+        self.assertNotIn(f"id: {first['id']}\n", body)
+        self.assertIn(f"id: {first['id'] + 1}\nevent: sold", body)
+        self.assertNotIn('event: reset', body)
+
+    def test_reset_when_events_were_dropped(self):
+
+        first = events.broker.Publish(events.LISTED, self._Data())
+        events.broker.events.clear()
+        events.broker.Publish(events.SOLD, self._Data())
+
+        status_code, body = self._Stream(f"last_event_id={first['id'] - 1}")
+        self.assertTrue(body.startswith('event: reset'))
+
+    def test_reset_when_event_id_is_unknown(self):
+
+        # an id of another broker, ahead of this one
+        status_code, body = self._Stream(f"last_event_id={events.broker.last_id + 10}")
+        self.assertTrue(body.startswith('event: reset'))
+
+    def test_deliver_drops_ids_sent_before_reset(self):
+
+        last_id = events.broker.last_id
+        events.broker.Reset(last_id)
+
+        events.broker.Deliver({'id': last_id, 'event': events.LISTED, 'data': self._Data()})
+        events.broker.Deliver({'id': last_id + 1, 'event': events.SOLD, 'data': self._Data()})
+        self.assertEqual([event['id'] for event in events.broker.events], [last_id + 1])
+        self.assertEqual(events.broker.last_id, last_id + 1)
+
+    def test_reset_closes_streams(self):
+
+        async def run():
+            queue = asyncio.Queue()
+            subscription, _, _ = events.broker.Subscribe(asyncio.get_running_loop(), queue, 10)
+            events.broker.Reset(events.broker.last_id + 5)
+            return await asyncio.wait_for(queue.get(), 1), events.broker.Subscribe(
+                asyncio.get_running_loop(), asyncio.Queue(), 10, subscription.last_id)
+
+        closed, (subscription, backlog, missed) = async_to_sync(run)()
+        events.broker.Unsubscribe(subscription)
+        self.assertIsNone(closed)
+        self.assertTrue(missed)
+
+    def test_stream_requires_token(self):
+
+        self.access_token = 'invalid'
+        self.assertEqual(self._Stream()[0], 401)
+
+    def test_stream_rejects_bad_filters(self):
+        self.assertEqual(self._Stream('min_price=cheap')[0], 400)
+
+    def test_listing_and_buying_publish_events(self):
+
+        player = self.team.player_set.first()
+        for asked_price in (1000, 2000):
+            response = self.client.post(
+                api_reverse('soccer-manager:marketlist-list-create'), 
+                HTTP_AUTHORIZATION='Bearer ' + self.access_token,
+                data={'player_id': player.id, 'asked_price': asked_price}
+            )        
+            self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        buyer = User.objects.create_user('Jane', 'Buyer', 'buyer@soccer.com', 'abc1234')
+        create_team(sender=None, user_id=buyer.id)
+        response = self.client.patch(
+            api_reverse('soccer-manager:marketlist-ru', kwargs={'id': player.id}), 
+            HTTP_AUTHORIZATION='Bearer ' + buyer.tokens()['access'],
+            data={'team': Team.objects.get(owner=buyer).id}
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        published = [event for event in events.broker.events if event['data']['player_id'] == player.id][-3:]
+        self.assertEqual([event['event'] for event in published], [events.LISTED, events.PRICE_CHANGED, events.SOLD])
+        self.assertEqual(published[1]['data']['asked_price'], 2000)
+        self.assertEqual(published[2]['data']['buyer_team_name'], "Jane's Team")
+
+
+class MarketListBulkTestCase(APITestCase):
+
+    def setUp(self):
+
+        self.user       = User.objects.create_user('John', 'Verified', 'user@soccer.com', 'abc1234')
+        self.other_user = User.objects.create_user('Jane', 'Other', 'other@soccer.com', 'abc1234')
+        create_team(sender=None, user_id=self.user.id)
+        create_team(sender=None, user_id=self.other_user.id)
+
+        self.access_token   = self.user.tokens()['access']
+        self.players        = list(Team.objects.get(owner=self.user).player_set.all())
+        self.other_player   = Team.objects.get(owner=self.other_user).player_set.first()
+
+    def _Post(self, items):
+
+        return self.client.post(
+            api_reverse('soccer-manager:marketlist-bulk-create'),
+            data={'players': [{'player_id': player_id, 'asked_price': price} for player_id, price in items]},
+            format='json',
+            HTTP_AUTHORIZATION='Bearer ' + self.access_token,
+        )
+
+    def test_list_whole_squad(self):
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self._Post([(player.id, 1000 + i) for i, player in enumerate(self.players)])
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertFalse(any(result['error'] for result in response.data['results']))
+        self.assertEqual(MarketList.objects.count(), len(self.players))
+
+        # user, players, listed players, prices, listings
+        writes = [query for query in queries if not query['sql'].startswith(('SAVEPOINT', 'RELEASE'))]
+        self.assertEqual(len(writes), 5)
+
+        for i, player in enumerate(self.players):
+            listing = MarketList.objects.get(player_id=player.id)
+            self.assertEqual(listing.asked_price, 1000 + i)
+            self.assertEqual(Player.objects.get(id=player.id).asked_price, 1000 + i)
+
+    def test_partial_failure(self):
+
+        MarketList.ListPlayer(self.players[0], 500)
+
+        response = self._Post([(self.players[0].id, 700), (self.other_player.id, 700), (0, 700), (self.players[1].id, 800), (self.players[1].id, 900)])
+        self.assertEqual(response.status_code, status.HTTP_207_MULTI_STATUS)
+
+        errors = [result['error'] for result in response.data['results']]
+        self.assertIsNone(errors[0])
+        self.assertIn("don't own", errors[1])
+        self.assertIn('not found', errors[2])
+        self.assertIsNone(errors[3])
+        self.assertIn('repeated', errors[4])
+
+        self.assertEqual(MarketList.objects.get(player_id=self.players[0].id).asked_price, 700)
+        self.assertEqual(MarketList.objects.get(player_id=self.players[1].id).asked_price, 800)
+        self.assertFalse(MarketList.objects.filter(player_id=self.other_player.id).exists())
+
+    def test_empty_list(self):
+        self.assertEqual(self._Post([]).status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class MarketListBuyPlayersTestCase(APITestCase):
+
+    def setUp(self):
+
+        self.buyer      = User.objects.create_user('John', 'Buyer', 'buyer@soccer.com', 'abc1234')
+        self.sellers    = [User.objects.create_user('Jane', f'Seller{i}', f'seller{i}@soccer.com', 'abc1234') for i in range(2)]
+        for user in [self.buyer] + self.sellers:
+            create_team(sender=None, user_id=user.id)
+
+        self.buyer_team     = Team.objects.get(owner=self.buyer)
+        self.seller_teams   = [Team.objects.get(owner=seller) for seller in self.sellers]
+
+        # two players from the first seller, one from the second
+        self.players = list(self.seller_teams[0].player_set.all()[:2]) + [self.seller_teams[1].player_set.first()]
+        for player in self.players:
+            MarketList.ListPlayer(player, 100000)
+
+        self.access_token = self.buyer.tokens()['access']
+
+    def _Buy(self, player_ids, **data):
+
+        return self.client.post(
+            api_reverse('soccer-manager:marketlist-buy'),
+            data=dict(players=player_ids, **data),
+            format='json',
+            HTTP_AUTHORIZATION='Bearer ' + self.access_token,
+        )
+
+    def _AssertValuesConsistent(self, *teams):
+
+        for team in teams:
+            team.refresh_from_db()
+            self.assertAlmostEqual(team.value, sum(team.player_set.values_list('market_value', flat=True)), places=2)
+
+    def test_buy_players_from_two_sellers(self):
+
+        sold_values = [player.market_value for player in self.players]
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self._Buy([player.id for player in self.players])
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data['players']), 3)
+
+        # one budget and value update per team
+        team_updates = [query for query in queries if query['sql'].startswith('UPDATE "soccer_manager_team"')]
+        self.assertEqual(len(team_updates), 3)
+
+        self.buyer_team.refresh_from_db()
+        self.assertEqual(self.buyer_team.budget, 5000000 - 300000)
+        self.assertEqual(self.buyer_team.player_set.count(), 23)
+        self.assertFalse(MarketList.objects.exists())
+
+        for team, price, value in [(self.seller_teams[0], 200000, sum(sold_values[:2])), (self.seller_teams[1], 100000, sold_values[2])]:
+            value_before = team.value
+            team.refresh_from_db()
+            self.assertEqual(team.budget, 5000000 + price)
+            self.assertAlmostEqual(team.value, value_before - value, places=2)
+
+        self._AssertValuesConsistent(self.buyer_team, *self.seller_teams)
+
+    def test_purchase_is_atomic(self):
+
+        Team.objects.filter(id=self.buyer_team.id).update(budget=250000)
+
+        response = self._Buy([player.id for player in self.players])
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        self.assertEqual(MarketList.objects.count(), 3)
+        self.assertEqual(self.buyer_team.player_set.count(), 20)
+        self.assertEqual(Team.objects.get(id=self.buyer_team.id).budget, 250000)
+
+        response = self._Buy([self.players[0].id, self.seller_teams[0].player_set.last().id])
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        self.assertEqual(MarketList.objects.count(), 3)
+
+    def test_buy_own_or_foreign_team(self):
+
+        response = self._Buy([self.buyer_team.player_set.first().id])
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+        response = self._Buy([self.players[0].id], team=self.seller_teams[1].id)
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+        response = self._Buy([self.players[0].id, self.players[0].id])
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+
+class ConditionalGetTestCase(APITestCase):
+
+    def setUp(self):
+
+        cache.clear()
+
+        self.admin_user = User.objects.create_superuser('John', 'Admin', 'admin@soccer.com', 'abc1234')
+        self.user       = User.objects.create_user('John', 'Verified', 'user@soccer.com', 'abc1234')
+        create_team(sender=None, user_id=self.admin_user.id)
+        create_team(sender=None, user_id=self.user.id)
+
+        self.admin_token    = self.admin_user.tokens()['access']
+        self.user_token     = self.user.tokens()['access']
+        self.team           = Team.objects.get(owner=self.user)
+        self.player         = self.team.player_set.first()
+
+    def _Get(self, url, token=None, **headers):
+        return self.client.get(url, HTTP_AUTHORIZATION='Bearer ' + (token or self.user_token), **headers)
+
+    def test_unchanged_list_skips_the_query(self):
+
+        for url in [api_reverse('soccer-manager:team-list-create'), api_reverse('soccer-manager:player-list-create'),
+                    api_reverse('soccer-manager:marketlist-list-create')]:
+
+            response = self._Get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+            # nothing is read, the account state of the token is cached
+            with self.assertNumQueries(0):
+                response = self._Get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+            self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+            self.assertFalse(response.content)
+
+    def test_change_gives_a_new_etag(self):
+
+        url     = api_reverse('soccer-manager:team-rud', kwargs={'id': self.team.id})
+        etag    = self._Get(url)['ETag']
+
+        response = self.client.patch(url, {'name': 'Renamed'}, HTTP_AUTHORIZATION='Bearer ' + self.user_token)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        response = self._Get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['name'], 'Renamed')
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_buy_changes_player_etag(self):
+
+        url     = api_reverse('soccer-manager:player-rud', kwargs={'id': self.player.id})
+        etag    = self._Get(url, self.admin_token)['ETag']
+        self.assertEqual(self._Get(url, self.admin_token, HTTP_IF_NONE_MATCH=etag).status_code, status.HTTP_304_NOT_MODIFIED)
+
+        MarketList.ListPlayer(self.player, 1000)
+        Team.objects.get(owner=self.admin_user).BuyPlayers([self.player])
+
+        self.assertEqual(self._Get(url, self.admin_token, HTTP_IF_NONE_MATCH=etag).status_code, status.HTTP_200_OK)
+
+    def test_if_modified_since(self):
+
+        url         = api_reverse('soccer-manager:player-rud', kwargs={'id': self.player.id})
+        modified    = self._Get(url)['Last-Modified']
+
+        self.assertEqual(self._Get(url, HTTP_IF_MODIFIED_SINCE=modified).status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(self._Get(url, HTTP_IF_MODIFIED_SINCE='Thu, 01 Jan 1970 00:00:00 GMT').status_code, status.HTTP_200_OK)
+
+    def test_validators_expire(self):
+
+        # another process with its own cache never sees the bumps, its versions have to
+        # run out like the responses
+        url     = api_reverse('soccer-manager:team-rud', kwargs={'id': self.team.id})
+        etag    = self._Get(url)['ETag']
+        Team.objects.filter(id=self.team.id).update(name='Renamed')
+
+        self.assertEqual(self._Get(url, HTTP_IF_NONE_MATCH=etag).status_code, status.HTTP_304_NOT_MODIFIED)
+        with mock.patch('time.time', return_value=time.time() + settings.RESPONSE_CACHE_TIMEOUT + 1):
+            response = self._Get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['name'], 'Renamed')
+
+    def test_views_must_declare_keys(self):
+
+        with self.assertRaises(ImproperlyConfigured):
+            type('NoKeysAPIView', (ConditionalGetMixin, GenericAPIView), {})
+
+        view = type('KeysAPIView', (ConditionalGetMixin, GenericAPIView), {'validator_keys': [('test',)]})
+        self.assertEqual(view().get_validator_keys(), [('test',)])
+
+    def test_permissions_checked_before_304(self):
+
+        other_user = User.objects.create_user('Jane', 'Other', 'other@soccer.com', 'abc1234')
+        for name in ['team-rud', 'player-rud']:
+            url = api_reverse(f'soccer-manager:{name}', kwargs={'id': self.player.id if name == 'player-rud' else self.team.id})
+            self._Get(url)
+            response = self._Get(url, other_user.tokens()['access'], HTTP_IF_NONE_MATCH='*')
+            self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+
+class RowSerializerTestCase(APITestCase):
+
+    def setUp(self):
+
+        self.user = User.objects.create_user('John', 'Verified', 'user@soccer.com', 'abc1234')
+        create_team(sender=None, user_id=self.user.id)
+        # a pool team has no owner, null values take the same path as in the serializers
+        build_team('Unnamed')
+        for player in Player.objects.all()[:5]:
+            MarketList.ListPlayer(player, 1500000.5)
+
+    def _AssertSameJson(self, serializer_class, queryset):
+
+        rows = row_serializer(serializer_class)
+        self.assertEqual(
+            JSONRenderer().render(rows.Serialize(rows.Read(queryset))),
+            JSONRenderer().render(serializer_class(queryset, many=True).data),
+        )
+
+    def test_same_output_as_serializers(self):
+
+        self._AssertSameJson(PlayerAdminUserSerializer, Player.objects.all())
+        self._AssertSameJson(TeamAdminUserSerializer, Team.objects.all())
+        self._AssertSameJson(MarketListDetailSerializer, MarketList.objects.all())
+
+    def test_list_endpoints(self):
+
+        access_token = self.user.tokens()['access']
+        response = self.client.get(api_reverse('soccer-manager:marketlist-list-create'), {'ordering': 'asked_price', 'cursor': ''},
+                                   HTTP_AUTHORIZATION='Bearer ' + access_token)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            JSONRenderer().render(response.data['results']),
+            JSONRenderer().render(MarketListDetailSerializer(MarketList.objects.order_by('asked_price', 'id'), many=True).data),
+        )
+
+    def test_bench_command(self):
+
+        out = StringIO()
+        call_command('bench_serializers', sizes='5', repeat=1, stdout=out)
+        self.assertIn('marketlist', out.getvalue())
+
+
+class SparseFieldsTestCase(APITestCase):
+
+    def setUp(self):
+
+        cache.clear()
+
+        self.admin_user = User.objects.create_superuser('John', 'Admin', 'admin@soccer.com', 'abc1234')
+        self.user       = User.objects.create_user('John', 'Verified', 'user@soccer.com', 'abc1234')
+        create_team(sender=None, user_id=self.admin_user.id)
+        create_team(sender=None, user_id=self.user.id)
+
+        self.admin_token    = self.admin_user.tokens()['access']
+        self.user_token     = self.user.tokens()['access']
+        self.team           = Team.objects.get(owner=self.user)
+        self.player         = self.team.player_set.first()
+
+    def _Get(self, url, params, token=None):
+        return self.client.get(url, params, HTTP_AUTHORIZATION='Bearer ' + (token or self.user_token))
+
+    def test_fields_trim_the_select(self):
+
+        url = api_reverse('soccer-manager:player-list-create')
+        with CaptureQueriesContext(connection) as queries:
+            response = self._Get(url, {'fields': 'first_name,last_name'}, self.admin_token)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(list(response.data['results'][0]), ['first_name', 'last_name'])
+        page_query = queries.captured_queries[-1]['sql']
+        self.assertIn('first_name', page_query)
+        self.assertNotIn('country', page_query.split('FROM')[0])
+
+        url = api_reverse('soccer-manager:player-rud', kwargs={'id': self.player.id})
+        response = self._Get(url, {'fields': 'age'})
+        self.assertEqual(response.data, {'age': self.player.age})
+
+    def test_unknown_fields(self):
+
+        url = api_reverse('soccer-manager:team-list-create')
+        self.assertEqual(self._Get(url, {'fields': 'name,password'}).status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self._Get(url, {'expand': 'owner'}).status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_expand_players_with_one_query(self):
+
+        url = api_reverse('soccer-manager:team-list-create')
+        with CaptureQueriesContext(connection) as queries:
+            response = self._Get(url, {'expand': 'players', 'fields': 'id'}, self.admin_token)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        player_queries = [query for query in queries.captured_queries if '"soccer_manager_player"' in query['sql']]
+        self.assertEqual(len(player_queries), 1)
+
+        teams = {team['id']: team['players'] for team in response.data['results']}
+        self.assertEqual(len(teams), 2)
+        self.assertEqual(len(teams[self.team.id]), self.team.player_set.count())
+        self.assertEqual(
+            JSONRenderer().render(teams[self.team.id]),
+            JSONRenderer().render(PlayerAdminUserSerializer(self.team.player_set.all(), many=True).data),
+        )
+
+        # the detail gives the same body through the serializers and a prefetch, after
+        # the first request of the user reads their account state
+        url = api_reverse('soccer-manager:team-rud', kwargs={'id': self.team.id})
+        with self.assertNumQueries(3):
+            response = self._Get(url, {'expand': 'players', 'fields': 'name'})
+        self.assertEqual(JSONRenderer().render(response.data['players']), JSONRenderer().render(teams[self.team.id]))
+
+    def test_players_of_other_teams_not_expanded(self):
+
+        # users see every team in the list but only the players of their own
+        url = api_reverse('soccer-manager:team-list-create')
+        response = self._Get(url, {'expand': 'players'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('expand', response.data)
+        self.assertEqual(self._Get(url, {'fields': 'players'}).status_code, status.HTTP_400_BAD_REQUEST)
+
+        response = self._Get(url, {})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['count'], 2)
+        self.assertNotIn(b'market_value', JSONRenderer().render(response.data))
+
+        url = api_reverse('soccer-manager:team-rud', kwargs={'id': self.team.id})
+        self.assertEqual(self._Get(url, {'expand': 'players'}).status_code, status.HTTP_200_OK)
+
+    def test_expand_team(self):
+
+        team_data = TeamAdminUserSerializer(self.team).data
+        for url in [api_reverse('soccer-manager:player-list-create'), api_reverse('soccer-manager:player-rud', kwargs={'id': self.player.id})]:
+            response = self._Get(url, {'expand': 'team', 'fields': 'id'})
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            data = response.data['results'][0] if 'results' in response.data else response.data
+            self.assertEqual(list(data), ['id', 'team'])
+            self.assertEqual(JSONRenderer().render(data['team']), JSONRenderer().render(team_data))
+
+    def test_expansion_changes_with_related_objects(self):
+
+        url     = api_reverse('soccer-manager:team-rud', kwargs={'id': self.team.id})
+        etag    = self._Get(url, {'expand': 'players'})['ETag']
+
+        Player.objects.filter(id=self.player.id).update(age=99)
+        Player.objects.get(id=self.player.id).save()
+
+        response = self.client.get(url, {'expand': 'players'}, HTTP_AUTHORIZATION='Bearer ' + self.user_token, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn(99, [player['age'] for player in response.data['players']])
+
+    def test_permissions_still_apply(self):
+
+        other_team = Team.objects.get(owner=self.admin_user)
+        url = api_reverse('soccer-manager:team-rud', kwargs={'id': other_team.id})
+        self.assertEqual(self._Get(url, {'fields': 'name', 'expand': 'players'}).status_code, status.HTTP_403_FORBIDDEN)
+
+
+class ExportTestCase(APITestCase):
+
+    def setUp(self):
+
+        self.admin_user = User.objects.create_superuser('John', 'Admin', 'admin@soccer.com', 'abc1234')
+        self.user       = User.objects.create_user('John', 'Verified', 'user@soccer.com', 'abc1234')
+        create_team(sender=None, user_id=self.admin_user.id)
+        create_team(sender=None, user_id=self.user.id)
+
+        self.admin_token = self.admin_user.tokens()['access']
+        for index, player in enumerate(Player.objects.all()[:10]):
+            MarketList.ListPlayer(player, 1000 * (index + 1))
+
+    def _Export(self, name, export_format, params=None, token=None):
+
+        url = api_reverse(f'soccer-manager:{name}-export', kwargs={'export_format': export_format})
+        return self.client.get(url, params or {}, HTTP_AUTHORIZATION='Bearer ' + (token or self.admin_token))
+
+    @override_settings(EXPORT_CHUNK_SIZE=7)
+    def test_csv(self):
+
+        response = self._Export('player', 'csv')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'text/csv')
+
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0].split(','), list(PlayerAdminUserSerializer().fields))
+        self.assertEqual(len(lines), Player.objects.count() + 1)
+
+        lines = b''.join(self._Export('marketlist', 'csv').streaming_content).decode().splitlines()
+        self.assertTrue(lines[0].startswith('player.id,player.first_name,'))
+
+    @override_settings(EXPORT_CHUNK_SIZE=3)
+    def test_ndjson_with_list_filters(self):
+
+        response = self._Export('marketlist', 'ndjson', {'min_price': 5000})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+        expected = MarketListDetailSerializer(MarketList.objects.filter(asked_price__gte=5000), many=True).data
+        self.assertEqual(rows, json.loads(JSONRenderer().render(expected)))
+        self.assertEqual(len(rows), 6)
+
+    def test_admin_only(self):
+
+        self.assertEqual(self._Export('team', 'csv', token=self.user.tokens()['access']).status_code, status.HTTP_403_FORBIDDEN)
+        self.assertEqual(self._Export('team', 'xml').status_code, status.HTTP_404_NOT_FOUND)
+
+
+class TeamRosterTestCase(APITestCase):
+
+    def setUp(self):
+
+        cache.clear()
+
+        self.admin_user = User.objects.create_superuser('John', 'Admin', 'admin@soccer.com', 'abc1234')
+        self.user       = User.objects.create_user('John', 'Verified', 'user@soccer.com', 'abc1234')
+        create_team(sender=None, user_id=self.admin_user.id)
+        create_team(sender=None, user_id=self.user.id)
+
+        self.user_token = self.user.tokens()['access']
+        self.team       = Team.objects.get(owner=self.user)
+        self.url        = api_reverse('soccer-manager:team-roster', kwargs={'id': self.team.id})
+
+    def _Get(self, url=None, token=None):
+        return self.client.get(url or self.url, HTTP_AUTHORIZATION='Bearer ' + (token or self.user_token))
+
+    def test_summary_in_one_query(self):
+
+        players = list(self.team.player_set.all())
+        MarketList.ListPlayer(players[0], 1234)
+
+        with self.assertNumQueries(1):
+            summary = Team.RosterSummary(self.team.id)
+
+        self.assertEqual(summary['players'], len(players))
+        self.assertEqual(summary['budget'], self.team.budget)
+        self.assertAlmostEqual(summary['value'], sum(player.market_value for player in players))
+        self.assertAlmostEqual(summary['age']['average'], sum(player.age for player in players) / len(players))
+        self.assertEqual(summary['age']['max'], max(player.age for player in players))
+        self.assertEqual((summary['listed'], summary['asked_price']), (1, 1234))
+
+        self.assertEqual(list(summary['positions']), list(TEAM_COMPOSITION))
+        for position, required in TEAM_COMPOSITION.items():
+            self.assertEqual(summary['positions'][position]['players'], len([player for player in players if player.position == position]))
+            self.assertEqual(summary['positions'][position]['required'], required)
+        self.assertEqual(summary['positions'][players[0].position]['listed'], 1)
+
+        self.assertIsNone(Team.RosterSummary(0))
+
+    def test_cached_until_the_squad_changes(self):
+
+        response = self._Get()
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(self._Get()['X-Cache'], 'HIT')
+
+        MarketList.ListPlayer(self.team.player_set.first(), 1000)
+        response = self._Get()
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.data['listed'], 1)
+
+        etag = response['ETag']
+        player = self.team.player_set.last()
+        player.age += 1
+        player.save()
+        response = self.client.get(self.url, HTTP_AUTHORIZATION='Bearer ' + self.user_token, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_permissions(self):
+
+        other_team = Team.objects.get(owner=self.admin_user)
+        url = api_reverse('soccer-manager:team-roster', kwargs={'id': other_team.id})
+        self.assertEqual(self._Get(url).status_code, status.HTTP_403_FORBIDDEN)
+        self.assertEqual(self._Get(url, self.admin_user.tokens()['access']).status_code, status.HTTP_200_OK)
+
+        url = api_reverse('soccer-manager:team-roster', kwargs={'id': 0})
+        self.assertEqual(self._Get(url).status_code, status.HTTP_404_NOT_FOUND)
+
+
+class RankingTestCase(SimpleTestCase):
+
+    def test_same_order_as_a_sort(self):
+
+        rng     = generation.rng()
+        ranking = leaderboard.Ranking()
+        scores  = {}
+        for _ in range(500):
+            team_id = rng.randrange(50)
+            if rng.random() < 0.2:
+                ranking.Remove(team_id)
+                scores.pop(team_id, None)
+            else:
+                scores[team_id] = float(rng.randrange(10))
+                ranking.Set(team_id, scores[team_id])
+
+        expected = sorted(scores, key=lambda team_id: (-scores[team_id], team_id))
+        self.assertEqual([team_id for team_id, _ in ranking.Top(len(scores) + 5)], expected)
+        self.assertEqual([ranking.Rank(team_id) for team_id in expected], list(range(1, len(expected) + 1)))
+        self.assertEqual(ranking.Top(3, 2), [(team_id, scores[team_id]) for team_id in expected[2:5]])
+
+
+@mock.patch('soccer_manager.leaderboard.transaction.on_commit', lambda callback: callback())
+class LeaderboardTestCase(APITestCase):
+
+    def setUp(self):
+
+        leaderboard.board.Clear()
+
+        self.users = [User.objects.create_user('John', f'User{index}', f'user{index}@soccer.com', 'abc1234') for index in range(3)]
+        for user in self.users:
+            create_team(sender=None, user_id=user.id)
+        build_team('Unnamed')
+
+        self.token = self.users[0].tokens()['access']
+        self.teams = list(Team.objects.filter(owner__isnull=False))
+
+    def tearDown(self):
+        leaderboard.board.Clear()
+
+    def _Get(self, url, params=None):
+        return self.client.get(url, params or {}, HTTP_AUTHORIZATION='Bearer ' + self.token)
+
+    def _Expected(self, field):
+        return list(Team.objects.filter(owner__isnull=False).order_by('-' + field, 'id').values_list('id', field))
+
+    def test_top(self):
+
+        Team.objects.filter(id=self.teams[1].id).update(budget=9000000.0)
+
+        response = self._Get(api_reverse('soccer-manager:team-leaderboard'), {'by': 'budget', 'limit': 2})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['count'], len(self.teams))
+        self.assertEqual([(team['id'], team['budget']) for team in response.data['results']], self._Expected('budget')[:2])
+        self.assertEqual(response.data['results'][0]['rank'], 1)
+
+        response = self._Get(api_reverse('soccer-manager:team-leaderboard'), {'by': 'owner'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_incremental_updates(self):
+
+        url = api_reverse('soccer-manager:team-rank', kwargs={'id': self.teams[2].id})
+        self.assertEqual(self._Get(url).status_code, status.HTTP_200_OK)
+
+        # a player value change moves the team without reloading the board
+        player = self.teams[2].player_set.first()
+        player.market_value += 5000000
+        with CaptureQueriesContext(connection) as queries:
+            player.save()
+        self.assertFalse([query for query in queries.captured_queries if 'owner_id" IS NOT NULL' in query['sql']])
+
+        response = self._Get(url)
+        self.assertEqual(response.data['value'], {'rank': 1, 'score': Team.objects.get(id=self.teams[2].id).value})
+
+        # a purchase moves the budgets of both teams
+        buyer, seller = self.teams[0], self.teams[2]
+        player = seller.player_set.last()
+        MarketList.ListPlayer(player, 3000000)
+        buyer.BuyPlayers([player])
+
+        ranks = {team_id: rank for rank, (team_id, _) in enumerate(self._Expected('budget'), 1)}
+        for team in (buyer, seller):
+            response = self._Get(api_reverse('soccer-manager:team-rank', kwargs={'id': team.id}))
+            self.assertEqual(response.data['budget']['rank'], ranks[team.id])
+        self.assertEqual(leaderboard.board.Top('value', 10)[0], self._Expected('value'))
+
+    def test_queries_run_without_the_lock(self):
+
+        board   = leaderboard.board
+        read    = board._Rows
+
+        def rows(**filters):
+            self.assertFalse(board.lock.locked())
+            return read(**filters)
+
+        with mock.patch.object(board, '_Rows', side_effect=rows) as mocked:
+            board.Top('value', 10)
+            board.Refresh([self.teams[0].id])
+            with override_settings(LEADERBOARD_RELOAD=-1):
+                board.Ranks(self.teams[0].id)
+        self.assertEqual(mocked.call_count, 3)
+
+    def test_refresh_during_reload(self):
+
+        board   = leaderboard.board
+        read    = board._Rows
+        board.Top('value', 10)
+
+        # a team changes while the reload reads an older copy of the table
+        def rows(**filters):
+            if 'owner__isnull' not in filters:
+                return read(**filters)
+
+            result = list(read(**filters))
+            Team.objects.filter(id=self.teams[1].id).update(value=99000000.0)
+            board.Refresh([self.teams[1].id])
+            return mock.Mock(iterator=lambda: iter(result))
+
+        with mock.patch.object(board, '_Rows', side_effect=rows), override_settings(LEADERBOARD_RELOAD=-1):
+            board.Top('value', 10)
+
+        self.assertEqual(board.Top('value', 1)[0], [(self.teams[1].id, 99000000.0)])
+
+    def test_pool_teams_are_not_ranked(self):
+
+        pool_team = Team.objects.filter(owner__isnull=True).first()
+        url = api_reverse('soccer-manager:team-rank', kwargs={'id': pool_team.id})
+        self.assertEqual(self._Get(url).status_code, status.HTTP_404_NOT_FOUND)
+
+
+class RequestTeamTestCase(APITestCase):
+
+    def setUp(self):
+
+        cache.clear()
+
+        self.admin_user = User.objects.create_superuser('John', 'Admin', 'admin@soccer.com', 'abc1234')
+        self.user       = User.objects.create_user('John', 'Verified', 'user@soccer.com', 'abc1234')
+        create_team(sender=None, user_id=self.admin_user.id)
+        create_team(sender=None, user_id=self.user.id)
+
+        self.user_token = self.user.tokens()['access']
+        self.team       = Team.objects.get(owner=self.user)
+        self.player     = self.team.player_set.first()
+        self.other      = Team.objects.get(owner=self.admin_user).player_set.first()
+
+    def _Request(self, method, url, data=None, token=None):
+        return getattr(self.client, method)(url, data, format='json', HTTP_AUTHORIZATION='Bearer ' + (token or self.user_token))
+
+    def test_player_permission_without_related_loads(self):
+
+        url = api_reverse('soccer-manager:player-rud', kwargs={'id': self.player.id})
+
+        # account state with the team id, player
+        with self.assertNumQueries(2):
+            response = self._Request('get', url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        url = api_reverse('soccer-manager:player-rud', kwargs={'id': self.other.id})
+        self.assertEqual(self._Request('get', url).status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_market_requests(self):
+
+        url = api_reverse('soccer-manager:marketlist-list-create')
+        self.assertEqual(self._Request('post', url, {'player_id': self.other.id, 'asked_price': 1000}).status_code, status.HTTP_403_FORBIDDEN)
+
+        # user, player and team, then the listing statements
+        with CaptureQueriesContext(connection) as queries:
+            response = self._Request('post', url, {'player_id': self.player.id, 'asked_price': 1000})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertFalse([query for query in queries.captured_queries if 'WHERE "soccer_manager_team"' in query['sql']])
+
+        # buying it back reads the user team once, from the database as for any write,
+        # and the seller with the player
+        MarketList.ListPlayer(self.other, 1000)
+        url = api_reverse('soccer-manager:marketlist-ru', kwargs={'id': self.other.id})
+        with CaptureQueriesContext(connection) as queries:
+            response = self._Request('put', url, {'team': self.team.id})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len([query for query in queries.captured_queries if '"soccer_manager_team"."owner_id" =' in query['sql']]), 1)
+        self.assertEqual(Player.objects.get(id=self.other.id).team_id, self.team.id)
+
+        self.assertEqual(self._Request('put', url, {'team': self.team.id}).status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_buy_players_reads_the_user_team_once(self):
+
+        url = api_reverse('soccer-manager:marketlist-buy')
+        for data in [{}, {'team': self.team.id}]:
+            player = Team.objects.get(owner=self.admin_user).player_set.first()
+            MarketList.ListPlayer(player, 1000)
+
+            with CaptureQueriesContext(connection) as queries:
+                response = self._Request('post', url, dict(players=[player.id], **data))
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual(response.data['team']['id'], self.team.id)
+            self.assertEqual(len([query for query in queries.captured_queries if '"soccer_manager_team"."owner_id" =' in query['sql']]), 1)
+
+        admin_team = Team.objects.get(owner=self.admin_user)
+        self.assertEqual(self._Request('post', url, {'team': admin_team.id, 'players': [self.player.id]}).status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_team_owner_changed(self):
+
+        url = api_reverse('soccer-manager:player-rud', kwargs={'id': self.player.id})
+        self.assertEqual(self._Request('get', url).status_code, status.HTTP_200_OK)
+
+        # changed by an admin, the account states of the owners are dropped here and
+        # the tokens claiming the old team are refused
+        new_owner = User.objects.create_user('Jane', 'Owner', 'owner@soccer.com', 'abc1234')
+        response = self._Request('patch', api_reverse('soccer-manager:team-rud', kwargs={'id': self.team.id}),
+                                 {'owner': new_owner.id}, self.admin_user.tokens()['access'])
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(self._Request('get', url).status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertEqual(self._Request('get', url, token=self.user.tokens()['access']).status_code, status.HTTP_403_FORBIDDEN)
+        self.assertEqual(self._Request('get', url, token=new_owner.tokens()['access']).status_code, status.HTTP_200_OK)
+
+        # changed by another process, writes still check the team in the database
+        Team.objects.filter(id=self.team.id).update(owner=self.user)
+        self.assertEqual(self._Request('patch', url, {'age': 30}, new_owner.tokens()['access']).status_code, status.HTTP_403_FORBIDDEN)
+        self.assertEqual(self._Request('patch', url, {'age': 30}).status_code, status.HTTP_200_OK)